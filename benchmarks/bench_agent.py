@@ -0,0 +1,212 @@
+import os, sys, json, time, shutil, argparse, platform, functools, statistics, tempfile, tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # config.json
+os.environ["AGENT_LLM_CACHE"] = "passthrough"
+import main as agent_main
+from utils.model import COMMUNICATOR_TYPES, MODELS
+from utils.router import MODEL_ROUTING
+from utils.parser import Parser, StreamParser, DELIMITER_STR
+from utils.processor import ToolProcessor, ToolStream
+from utils.context import ContextManager
+from tools.FileEditor import FileEditor
+from tools.Shell import ShellExecutor
+from tools.Database import Database, ENGINES
+
+# -- Scripted Transcript --
+# One realistic task: write a module, read and list in parallel, edit, run it,
+# store and read notes, list the tree and finish. "{task}" is the task number.
+D = DELIMITER_STR
+APP = "def greet(name):\n    return \"Hello \" + name\n\n" + "".join(f"def helper_{i}(values):\n    return [v * {i} for v in values if v % {i + 2}]\n\n" for i in range(60)) + "if __name__ == \"__main__\":\n    print(greet(\"bench\"))\n"
+SCRIPT = [
+    "I will start by writing the module.\n<<<FILE:'write'" + D + "'src/app.py'" + D + "'" + APP + "'>>>",
+    "Let me check the file and the project.\n<<<FILE:'read'" + D + "'src/app.py'" + D + "'1:20'>>><<<FILE:'list'" + D + "'.'" + D + "'lsc'" + D + "'[True, True, False, 0]'>>>",
+    "Use an f-string.\n<<<FILE:'edit'" + D + "'src/app.py'" + D + "'return \"Hello \" + name'" + D + "'return f\"Hello {name}\"'>>>",
+    "Run it.\n<<<SHELL:'" + sys.executable + " src/app.py && ls src | wc -l'>>>",
+    "Save notes.\n<<<DATA:'write'" + D + "'greets bench'" + D + "'tasks/{task}/output'>>><<<DATA:'write'" + D + "'done'" + D + "'tasks/{task}/status'>>>",
+    "Read the notes back.\n<<<DATA:'read'" + D + "'tasks/{task}'>>><<<DATA:'list'" + D + "'tasks'>>>",
+    "Final check of the tree.\n<<<FILE:'list'" + D + "'.'" + D + "'lsc'" + D + "'[True, True, True, 40]'>>>",
+    "<<<RESULT:'Task {task} done: src/app.py greets with an f-string.'>>>",
+]
+
+# -- Scripted Communicator --
+# Plays SCRIPT instead of calling a model and keeps an Ollama-style context.
+# Streamed responses are fed in CHUNK_SIZE pieces, like a real stream.
+CHUNK_SIZE = 64
+TURN_STARTS = []
+
+class ScriptedCommunicator:
+    def __init__(self, model_idx: str, mode: str="txt"):
+        self.model_idx = model_idx
+        self.mode = mode
+        self.turn = 0
+        self.task = 0
+        self.last_usage = None
+
+    def _respond(self, message: str, context: list) -> tuple[str, list]:
+        TURN_STARTS.append(time.perf_counter())
+        if not context: # A new task
+            self.turn = 0
+        response = SCRIPT[min(self.turn, len(SCRIPT) - 1)].replace("{task}", str(self.task))
+        self.turn += 1
+        self.last_usage = {"prompt_tokens": len(message) // 4 + 1, "response_tokens": len(response) // 4 + 1}
+        return response, context + [{"role": "user", "content": message}, {"role": "assistant", "content": response}]
+
+    def chat(self, message: str, context: list, on_chunk=None) -> tuple[str, list]:
+        response, updated_context = self._respond(message, context)
+        if on_chunk is not None:
+            for i in range(0, len(response), CHUNK_SIZE):
+                on_chunk(response[i:i + CHUNK_SIZE])
+        return response, updated_context
+
+    async def achat(self, message: str, context: list, on_chunk=None) -> tuple[str, list]:
+        return self.chat(message, context, on_chunk)
+
+COMMUNICATOR_TYPES["Scripted"] = ScriptedCommunicator
+MODELS["bench-scripted"] = {"type": "Scripted", "name": "scripted", "text": [True, True]}
+agent_main.LLM_MODEL = "bench-scripted"
+MODEL_ROUTING.pop("LLM", None) # No fallbacks: the timings stay those of the agent itself
+
+# -- Component Timers --
+# Inclusive wall time per call; tools running in the processor's thread pools are
+# timed there as well. "processor" contains the tools it ran.
+TIMINGS = {}
+COMPONENTS = [
+    ("parser", Parser, "tokenize"),
+    ("parser", StreamParser, "feed"),
+    ("processor", ToolProcessor, "process"),
+    ("processor", ToolStream, "finish"),
+    ("context", ContextManager, "compact"),
+    ("file_list", FileEditor, "list"),
+    ("file_io", FileEditor, "read"),
+    ("file_io", FileEditor, "write"),
+    ("file_io", FileEditor, "edit"),
+    ("shell", ShellExecutor, "execute"),
+    ("database", Database, "read"),
+    ("database", Database, "write"),
+    ("database", Database, "list"),
+]
+
+def timed(component: str, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            TIMINGS.setdefault(component, []).append(time.perf_counter() - start)
+    return wrapper
+
+for component, cls, method in COMPONENTS:
+    setattr(cls, method, timed(component, getattr(cls, method)))
+
+# -- Benchmark Run --
+# A small project in every workspace, so listings have something to walk
+def make_project(workspace: str, files: int):
+    for i in range(files):
+        directory = os.path.join(workspace, "pkg", f"module_{i % 10}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"file_{i}.py"), "w") as f:
+            f.write(f"VALUE_{i} = {i}\n" * 20)
+
+def run_tasks(root: str, tasks: int, files: int, stream: bool) -> dict:
+    agent_main.STREAM_RESPONSES = stream
+    activated_tools = {**agent_main.ACTIVATED_TOOLS, "ask_user": False, "wiki": False, "image_analyzer": False, "file_editor": True, "shell_executor": True, "database": True}
+    TIMINGS.clear()
+    TURN_STARTS.clear()
+    turns = 0
+    total = 0.0
+    for task in range(tasks):
+        workspace = os.path.join(root, f"task-{task}", "workspace")
+        make_project(workspace, files)
+        start = time.perf_counter()
+        database_path = os.path.join(root, f"task-{task}", "data.json")
+        agent = agent_main.Agent(base_dir=workspace, verbose=False, activated_tools=activated_tools, database_path=database_path)
+        TIMINGS.setdefault("agent_init", []).append(time.perf_counter() - start)
+        agent.llm.task = task
+        status, result, task_turns = agent.run(f"Bench task {task}", len(SCRIPT) + 2)
+        end = time.perf_counter()
+        TURN_STARTS.append(end)
+        agent.reset_context()
+        engine = ENGINES.pop(os.path.abspath(database_path), None)
+        if engine is not None: # Closed now, before the temporary directory is removed
+            engine.close()
+        if status != "FINISHED":
+            raise AssertionError(f"Task {task} ended with {status} after {task_turns} turns")
+        turns += task_turns
+        total += end - start
+        # Turn times of this task: from one model call to the next (or the end)
+        TIMINGS.setdefault("turn", []).extend(b - a for a, b in zip(TURN_STARTS[-task_turns - 1:-1], TURN_STARTS[-task_turns:]))
+    return {"tasks": tasks, "turns": turns, "seconds": total, "turns_per_second": turns / total}
+
+def percentiles(values: list) -> dict:
+    values = sorted(values)
+    cuts = statistics.quantiles(values, n=100, method="inclusive") if len(values) > 1 else values * 99
+    return {"count": len(values), "p50_ms": cuts[49] * 1000, "p90_ms": cuts[89] * 1000, "p99_ms": cuts[98] * 1000, "max_ms": values[-1] * 1000}
+
+def scenario(name: str, tasks: int, files: int, stream: bool) -> dict:
+    root = tempfile.mkdtemp(prefix="bench_agent_")
+    try:
+        run_tasks(os.path.join(root, "warmup"), 1, files, stream)
+        totals = run_tasks(os.path.join(root, "timed"), tasks, files, stream)
+        components = {component: percentiles(values) for component, values in sorted(TIMINGS.items())}
+        # A separate pass under tracemalloc, which slows everything down
+        tracemalloc.start()
+        run_tasks(os.path.join(root, "memory"), max(tasks // 4, 1), files, stream)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {"name": name, "stream": stream, **totals, "peak_memory_mb": peak / 2**20, "components": components}
+
+# Components whose p50 got slower than `threshold` times the baseline
+def regressions(results: dict, baseline: dict, threshold: float) -> list:
+    found = []
+    old_scenarios = {item["name"]: item for item in baseline["scenarios"]}
+    for item in results["scenarios"]:
+        old = old_scenarios.get(item["name"])
+        if old is None:
+            continue
+        if item["turns_per_second"] * threshold < old["turns_per_second"]:
+            found.append(f"{item['name']}: {old['turns_per_second']:.1f} -> {item['turns_per_second']:.1f} turns/s")
+        for component, stats in item["components"].items():
+            old_stats = old["components"].get(component)
+            if old_stats and stats["p50_ms"] > old_stats["p50_ms"] * threshold:
+                found.append(f"{item['name']}/{component}: p50 {old_stats['p50_ms']:.3f} -> {stats['p50_ms']:.3f} ms")
+    return found
+
+def main():
+    arguments = argparse.ArgumentParser(description="Drive Agent.run with a scripted model and time the agent's own code.")
+    arguments.add_argument("--tasks", type=int, default=20, help="timed tasks per scenario")
+    arguments.add_argument("--files", type=int, default=200, help="files in every task workspace")
+    arguments.add_argument("--out", default="bench_agent.json", help="JSON file for the results")
+    arguments.add_argument("--compare", metavar="BASELINE", help="earlier results; exit with 1 on regressions")
+    arguments.add_argument("--threshold", type=float, default=1.5, help="slowdown factor that counts as a regression")
+    args = arguments.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "script_turns": len(SCRIPT),
+        "files": args.files,
+        "scenarios": [scenario("batch", args.tasks, args.files, False), scenario("stream", args.tasks, args.files, True)],
+    }
+    for item in results["scenarios"]:
+        print(f"\n{item['name']}: {item['turns']} turns in {item['seconds']:.2f} s, {item['turns_per_second']:.1f} turns/s, peak {item['peak_memory_mb']:.1f} MB")
+        print(f"{'component':<12}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for component, stats in item["components"].items():
+            print(f"{component:<12}{stats['count']:>7}{stats['p50_ms']:>10.3f}{stats['p90_ms']:>10.3f}{stats['p99_ms']:>10.3f}{stats['max_ms']:>10.3f}")
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            found = regressions(results, json.load(f), args.threshold)
+        for line in found:
+            print(f"⚠️ Regression: {line}")
+        if found:
+            sys.exit(1)
+        print("No regressions.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import os, sys, json, time, shutil, tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # config.json
+from tools.FileEditor import FileEditor
+
+# -- Legacy File Editor --
+# The listing FileEditor.list replaced (separate isfile/isdir/getsize calls, an
+# extra os.walk for sizes and key-stripping passes), kept for the timings.
+class LegacyFileEditor(FileEditor):
+    def list(self, path: str=".", mode: str="ls", contents: list=[False, False, False, 0]) -> str:
+        include_size = contents[0]
+        include_type = contents[1]
+        include_content = contents[2]
+        max_content_len = contents[3] if contents[3] > 0 else float('inf')
+
+        top_level_data = {
+            "listed_path": path,
+            "size": 0,
+            "content": {}
+        }
+        
+        try:
+            full_dir_path = self._get_agent_path(path)
+
+            if not os.path.isdir(full_dir_path):
+                return json.dumps({"error": f"Directory not found or is not a directory at '{path}'."}, indent=4)
+
+            def _process_directory(current_abs_path, is_root=False):
+                current_dir_size = 0
+                current_dir_content = {}
+
+                entries = os.listdir(current_abs_path)
+
+                entries.sort()
+
+                for entry_name in entries:
+                    entry_abs_path = os.path.join(current_abs_path, entry_name)
+                    entry_details = {}
+
+                    if os.path.isfile(entry_abs_path):
+                        file_size = os.path.getsize(entry_abs_path)
+                        current_dir_size += file_size
+                        
+                        if include_type:
+                            entry_details["type"] = "file"
+                        if include_size:
+                            entry_details["size"] = file_size
+                        if include_content:
+                            try:
+                                with open(entry_abs_path, 'r', encoding='utf-8') as file:
+                                    file_content = file.read()
+                                    if len(file_content) > max_content_len:
+                                        entry_details["content"] = file_content[:int(max_content_len)] + "..."
+                                    else:
+                                        entry_details["content"] = file_content
+                            except Exception:
+                                entry_details["content"] = "Non readable content"
+                        current_dir_content[entry_name] = entry_details
+
+                    elif os.path.isdir(entry_abs_path):
+                        if mode == "lsc" or (mode == "ls" and is_root):
+                            subdir_result, subdir_size = _process_directory(entry_abs_path)
+                            current_dir_size += subdir_size
+                            
+                            subdir_details = {}
+                            if include_type:
+                                subdir_details["type"] = "directory"
+                            if include_size:
+                                subdir_details["size"] = subdir_size
+                            subdir_details["content"] = subdir_result
+                            current_dir_content[entry_name] = subdir_details
+                        elif mode == "ls" and not is_root:
+                            entry_details = {}
+                            if include_type:
+                                entry_details["type"] = "directory"
+                            current_dir_content[entry_name] = entry_details
+                            
+                return current_dir_content, current_dir_size
+
+            if mode == "ls":
+                def _build_dir_structure(current_abs_path, is_recursive_mode):
+                    current_struct_content = {}
+                    current_struct_size = 0
+
+                    try:
+                        entries = os.listdir(current_abs_path)
+                        entries.sort()
+                    except OSError:
+                        return {"error": "Cannot list directory"}, 0
+
+                    for entry_name in entries:
+                        entry_abs_path = os.path.join(current_abs_path, entry_name)
+                        entry_details = {}
+
+                        if os.path.isfile(entry_abs_path):
+                            file_size = os.path.getsize(entry_abs_path)
+                            current_struct_size += file_size
+                            
+                            if include_type:
+                                entry_details["type"] = "file"
+                            if include_size:
+                                entry_details["size"] = file_size
+                            if include_content:
+                                try:
+                                    with open(entry_abs_path, 'r', encoding='utf-8') as file:
+                                        file_content = file.read()
+                                        if len(file_content) > max_content_len:
+                                            entry_details["content"] = file_content[:int(max_content_len)] + "..."
+                                        else:
+                                            entry_details["content"] = file_content
+                                except Exception:
+                                    entry_details["content"] = "Non readable content"
+                            current_struct_content[entry_name] = entry_details
+
+                        elif os.path.isdir(entry_abs_path):
+                            subdir_content, subdir_size = {}, 0
+                            if is_recursive_mode:
+                                subdir_content, subdir_size = _build_dir_structure(entry_abs_path, True)
+                            elif mode == "ls" and include_content:
+                                temp_content, temp_size = _build_dir_structure(entry_abs_path, False)
+                                subdir_content = temp_content
+
+                                total_subdir_size = 0
+                                for _r, _d, _f in os.walk(entry_abs_path):
+                                    for _file in _f:
+                                        total_subdir_size += os.path.getsize(os.path.join(_r, _file))
+                                subdir_size = total_subdir_size
+
+                            current_struct_size += subdir_size
+
+                            dir_details = {}
+                            if include_type:
+                                dir_details["type"] = "directory"
+                            if include_size:
+                                dir_details["size"] = subdir_size
+                            if include_content:
+                                dir_details["content"] = subdir_content
+                            
+                            current_struct_content[entry_name] = dir_details
+                    
+                    return current_struct_content, current_struct_size
+
+                if mode == "lsc":
+                    processed_content, total_size = _build_dir_structure(full_dir_path, True)
+                elif mode == "ls":
+                    processed_content, total_size = _build_dir_structure(full_dir_path, False)
+                    total_size = 0
+                    for _r, _d, _f in os.walk(full_dir_path):
+                        for _file in _f:
+                            total_size += os.path.getsize(os.path.join(_r, _file))
+
+                else:
+                    return json.dumps({"error": "Invalid mode. Use 'ls' or 'lsc'."}, indent=4)
+
+                top_level_data["size"] = total_size
+                top_level_data["content"] = processed_content
+                
+                if not include_size:
+                    del top_level_data["size"]
+                    def _remove_key_recursive(d, key_to_remove):
+                        if isinstance(d, dict):
+                            d.pop(key_to_remove, None)
+                            for k, v in d.items():
+                                if k == "content" and isinstance(v, dict):
+                                    _remove_key_recursive(v, key_to_remove)
+                                elif isinstance(v, dict):
+                                    _remove_key_recursive(v, key_to_remove)
+                    
+                    _remove_key_recursive(top_level_data["content"], "size")
+                    
+                if not include_type:
+                    def _remove_key_recursive_type(d, key_to_remove):
+                        if isinstance(d, dict):
+                            d.pop(key_to_remove, None)
+                            for k, v in d.items():
+                                if k == "content" and isinstance(v, dict):
+                                    _remove_key_recursive_type(v, key_to_remove)
+                                elif isinstance(v, dict):
+                                    _remove_key_recursive_type(v, key_to_remove)
+                    
+                    _remove_key_recursive_type(top_level_data["content"], "type")
+                
+                if not include_content:
+                    def _remove_key_recursive_content(d, key_to_remove):
+                        if isinstance(d, dict):
+                            d.pop(key_to_remove, None)
+                            for k, v in d.items():
+                                if k == "content" and isinstance(v, dict):
+                                    _remove_key_recursive_content(v, key_to_remove)
+                                elif isinstance(v, dict):
+                                    _remove_key_recursive_content(v, key_to_remove)
+                    
+                    _remove_key_recursive_content(top_level_data["content"], "content")
+
+
+                if not top_level_data["content"] and include_content:
+                    top_level_data["content"] = "Directory is empty."
+                elif not top_level_data["content"]:
+                     top_level_data["content"] = {}
+            
+                return json.dumps(top_level_data, indent=4)
+
+        except FileNotFoundError:
+            return json.dumps({"error": f"Directory not found at '{path}'."}, indent=4)
+        except Exception as e:
+            return json.dumps({"error": f"An unexpected error occurred while listing '{path}': {e}"}, indent=4)
+
+# -- Synthetic Workspace --
+# `dirs` source directories with `subdirs` subdirectories of `files` small files
+# each, a node_modules folder of the same shape and a .gitignore for a build dir.
+def build_tree(root: str, dirs: int=20, subdirs: int=25, files: int=100):
+    for top in ("src", "node_modules", "build"):
+        for d in range(dirs if top != "build" else 2):
+            for s in range(subdirs):
+                path = os.path.join(root, top, f"pkg{d}", f"mod{s}")
+                os.makedirs(path)
+                for f in range(files):
+                    with open(os.path.join(path, f"file{f}.txt"), "w") as file:
+                        file.write("x" * (f % 50))
+    with open(os.path.join(root, ".gitignore"), "w") as file:
+        file.write("build/\n")
+    with open(os.path.join(root, "README.md"), "w") as file:
+        file.write("# Synthetic workspace\n")
+
+def count_files(root: str) -> int:
+    return sum(len(files) for _, _, files in os.walk(root))
+
+def best_of(function, repeat: int=3) -> tuple[float, str]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+def main():
+    root = tempfile.mkdtemp(prefix="bench_file_list_")
+    try:
+        build_tree(root)
+        print(f"Workspace: {count_files(root)} files in {root}")
+        editor, legacy = FileEditor(root), LegacyFileEditor(root)
+        # Under src nothing is ignored, and the contents case lifts the entry cap, so
+        # both listings cover the same entries. "same" compares the outputs; the
+        # legacy `ls` reported 0 as the size of every subdirectory.
+        cases = [
+            ("ls names", ("src", "ls", [False, False, False, 0]), {}),
+            ("ls sizes+types", ("src", "ls", [True, True, False, 0]), {}),
+            ("ls contents", ("src/pkg0", "ls", [True, True, True, 100]), {"max_entries": 10**6}),
+        ]
+        print(f"{'case':<18}{'legacy ms':>12}{'scandir ms':>12}{'speedup':>9}  same")
+        for name, args, options in cases:
+            legacy_time, legacy_result = best_of(lambda: legacy.list(*args))
+            new_time, result = best_of(lambda: editor.list(*args, **options))
+            print(f"{name:<18}{legacy_time * 1000:>12.1f}{new_time * 1000:>12.1f}{legacy_time / new_time:>8.1f}x  {json.loads(legacy_result) == json.loads(result)}")
+        print("Recursive listings (the legacy 'lsc' mode returned nothing):")
+        for name, call in [
+            ("lsc default", lambda: editor.list(".", "lsc", [True, True, False, 0])),
+            ("lsc depth 2", lambda: editor.list(".", "lsc", [True, True, False, 0], 2)),
+            ("lsc everything", lambda: editor.list(".", "lsc", [True, True, False, 0], None, 10**6)),
+        ]:
+            new_time, result = best_of(call)
+            data = json.loads(result)
+            print(f"{name:<18}{new_time * 1000:>12.1f} ms  {len(result):>10} chars  truncated={'truncated' in data}  ignored={data.get('ignored_entries', 0)}")
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import os, sys, random, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.parser import Parser, StreamParser, DELIMITER_STR
+
+# -- Legacy Parser --
+# The find-based implementation the tokenizer replaced, kept as reference for
+# the fuzz comparison and the timings.
+class LegacyParser:
+    def extract_tagged_sections(self, text: str) -> list[str] | str:
+        extracted = []
+        index = 0
+        stack = []
+        while index < len(text):
+            start = text.find("<<<", index)
+            end = text.find(">>>", index)
+            if start == -1 and end == -1:
+                break
+            if end != -1 and (start == -1 or end < start):
+                return "Error during parsing tool-format in your response"
+            if start != -1:
+                if stack:
+                    return "Error during parsing tool-format in your response"
+                stack.append(start)
+                end = text.find(">>>", start)
+                if end == -1:
+                    return "Error during parsing tool-format in your response"
+                content = text[start + 3:end]
+                if "<<<" in content or ">>>" in content:
+                    return "Error during parsing tool-format in your response"
+                extracted.append(content)
+                stack.pop()
+                index = end + 3
+            else:
+                index += 1
+        if stack:
+            return "Error during parsing tool-format in your response"
+        return extracted
+
+    def parse_tool_call(self, block: str) -> list[str]:
+        first_quote_index = block.find("'")
+        if first_quote_index == -1:
+            tool_name = block.strip()
+            if tool_name.endswith(":"):
+                tool_name = tool_name[:-1]
+            return [tool_name]
+        tool_name = block[:first_quote_index].strip()
+        if tool_name.endswith(":"):
+            tool_name = tool_name[:-1]
+        params = [tool_name]
+        for part_with_quote in block[first_quote_index:].split(DELIMITER_STR):
+            if part_with_quote.startswith("'") and part_with_quote.endswith("'"):
+                params.append(part_with_quote[1:-1])
+            else:
+                break
+        return params
+
+    # What ToolProcessor.process did: extract, parse every block, then parse the first one again
+    def process(self, text: str):
+        blocks = self.extract_tagged_sections(text)
+        if isinstance(blocks, str):
+            return blocks
+        calls = [self.parse_tool_call(block) for block in blocks]
+        if len(blocks) == 1:
+            self.parse_tool_call(blocks[0])
+        return calls
+
+# -- Fuzzing --
+FUZZ_ALPHABET = ["<", "<<", "<<<", "<<<<", ">", ">>", ">>>", ">>>>", "'", ":", "FILE", "RESULT", DELIMITER_STR, "a", " ", "\n"]
+
+def random_response(rng: random.Random) -> str:
+    return "".join(rng.choice(FUZZ_ALPHABET) for _ in range(rng.randint(0, 40)))
+
+def fuzz(iterations: int, seed: int=0) -> int:
+    rng = random.Random(seed)
+    parser, legacy = Parser(), LegacyParser()
+    for _ in range(iterations):
+        text = random_response(rng)
+        expected = legacy.process(text)
+        calls = parser.tokenize(text)
+        got = calls if isinstance(calls, str) else [[call.name, *call.args] for call in calls]
+        stream = StreamParser()
+        streamed = []
+        position = 0
+        while position < len(text):
+            size = rng.randint(1, 5)
+            streamed += stream.feed(text[position:position + size])
+            position += size
+        error = stream.close()
+        streamed = error if error else [[call.name, *call.args] for call in streamed]
+        if got != expected or streamed != expected:
+            raise AssertionError(f"Parser mismatch for {text!r}: expected {expected!r}, got {got!r} / streamed {streamed!r}")
+    return iterations
+
+# -- Benchmark Inputs --
+def large_file_write(size: int) -> str:
+    content = ("x = '<' if a > b else '>'\n" * (size // 26 + 1))[:size]
+    return f"Writing the file now.\n<<<FILE:'write'{DELIMITER_STR}'big.py'{DELIMITER_STR}'{content}'>>>"
+
+def many_calls(count: int) -> str:
+    return "".join(f"Step {i}: <<<DATA:'read'{DELIMITER_STR}'notes/{i}'>>>\n" for i in range(count))
+
+def marker_heavy(size: int) -> str:
+    return "<" * size + ">" * size
+
+def unclosed_block(size: int) -> str:
+    return "<<<FILE:'write'" + "a" * size
+
+def best_of(function, text: str, repeat: int=5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(text)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    print(f"Fuzz: {fuzz(20000)} random responses match the legacy parser (batch and streamed).")
+    parser, legacy = Parser(), LegacyParser()
+    cases = [
+        ("file write", large_file_write),
+        ("many calls", lambda n: many_calls(n // 40)),
+        ("marker heavy", lambda n: marker_heavy(n // 2)),
+        ("unclosed block", unclosed_block),
+    ]
+    print(f"{'case':<16}{'size':>10}{'legacy ms':>12}{'tokenize ms':>14}{'speedup':>9}")
+    for name, build in cases:
+        previous = None
+        for size in (1_000_000, 2_000_000, 4_000_000):
+            text = build(size)
+            legacy_time = best_of(legacy.process, text)
+            new_time = best_of(parser.tokenize, text)
+            growth = f"  x{new_time / previous:.1f}" if previous else ""
+            previous = new_time
+            print(f"{name:<16}{len(text):>10}{legacy_time * 1000:>12.2f}{new_time * 1000:>14.2f}{legacy_time / new_time:>8.1f}x{growth}")
+
+if __name__ == "__main__":
+    main()
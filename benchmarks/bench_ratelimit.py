@@ -0,0 +1,60 @@
+import os, sys, math, time, tempfile, shutil, multiprocessing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # config.json
+import utils.ratelimit as ratelimit
+from utils.ratelimit import RateLimiter
+
+# -- Benchmark Model --
+# A fake quota of LIMIT requests per WINDOW seconds, shared by all workers.
+WINDOW, LIMIT = 2.0, 20
+ratelimit.MODELS["bench"] = {"rate_limit": [WINDOW, LIMIT]}
+
+def worker(state_dir: str | None, duration: float, queue):
+    limiter = RateLimiter(state_dir)
+    calls = []
+    deadline = time.time() + duration
+    while True:
+        limiter.acquire("bench")
+        now = time.time()
+        if now >= deadline:
+            break
+        calls.append(now)
+    queue.put(calls)
+
+def run(workers: int, state_dir: str | None, duration: float) -> list:
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    processes = [context.Process(target=worker, args=(state_dir, duration, queue)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    calls = sorted(call for _ in processes for call in queue.get())
+    for process in processes:
+        process.join()
+    return calls
+
+# Most calls inside any window of WINDOW seconds
+def busiest_window(calls: list) -> int:
+    busiest, start = 0, 0
+    for end, call in enumerate(calls):
+        while call - calls[start] >= WINDOW:
+            start += 1
+        busiest = max(busiest, end - start + 1)
+    return busiest
+
+def main(duration: float=10.0):
+    burst, rate, window, limit = RateLimiter(None)._bucket("bench")
+    quota = min(burst + rate * duration, limit * math.ceil(duration / window)) # Full bucket plus the refill, capped by the windows
+    print(f"Quota: {LIMIT} requests per {WINDOW:.0f} s, {duration:.0f} s run -> at most {quota:.0f} requests, never more than {LIMIT} per window")
+    print(f"{'workers':>8}{'limiter':>14}{'requests':>10}{'of quota':>10}{'busiest window':>16}")
+    for workers in (1, 4, 16):
+        for name, shared in (("per process", False), ("shared", True)):
+            state_dir = tempfile.mkdtemp(prefix="bench_ratelimit_") if shared else None
+            try:
+                calls = run(workers, state_dir, duration)
+            finally:
+                if state_dir:
+                    shutil.rmtree(state_dir)
+            print(f"{workers:>8}{name:>14}{len(calls):>10}{len(calls) / quota:>9.0%}{busiest_window(calls):>16}")
+
+if __name__ == "__main__":
+    main()
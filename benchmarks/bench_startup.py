@@ -0,0 +1,47 @@
+import os, sys, subprocess, statistics, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SDK_MODULES = ["google.generativeai", "ollama", "PIL.Image", "wikipedia", "sqlite3"]
+
+# -- Startup Cases --
+# Every case runs in a fresh interpreter from the repository root (config.json).
+CASES = [
+    ("interpreter", "pass"),
+    ("import main", "import main"),
+    ("main.Agent()", "import main; main.Agent()"),
+]
+
+def run(code: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+    return time.perf_counter() - start
+
+def loaded_modules() -> list:
+    code = f"import sys, main; main.Agent(); print(','.join(m for m in {SDK_MODULES!r} if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, capture_output=True, text=True).stdout.strip()
+    return output.split(",") if output else []
+
+# Slowest imports by cumulative time, from `python -X importtime`
+def slowest_imports(code: str, count: int=10) -> list:
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((int(cumulative_us), int(self_us), name))
+    return sorted(rows, reverse=True)[:count]
+
+def main(repeat: int=15):
+    print(f"{'case':<16}{'median ms':>12}{'min ms':>10}")
+    for name, code in CASES:
+        run(code) # Warm the file system cache
+        timings = [run(code) for _ in range(repeat)]
+        print(f"{name:<16}{statistics.median(timings) * 1000:>12.1f}{min(timings) * 1000:>10.1f}")
+    print(f"SDK modules loaded after main.Agent(): {', '.join(loaded_modules()) or 'none'}")
+    print(f"\n{'cumulative us':>14}{'self us':>10}  module")
+    for cumulative_us, self_us, name in slowest_imports("import main; main.Agent()"):
+        print(f"{cumulative_us:>14}{self_us:>10}  {name}")
+
+if __name__ == "__main__":
+    main()
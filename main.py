@@ -5,84 +5,211 @@ from tools.Shell import ShellExecutor, SHELL_EXECUTOR_PROMPT
 from tools.WikiSearch import WikiSearch, WIKI_PROMPT
 from tools.ImageAnalyzer import ImageAnalyzer, IMAGE_ANALYZER_PROMPT
 from tools.Database import Database, DATABASE_PROMPT
-from utils.model import CreateCommunicator, Waiter, INIT_PROMPT
+from utils.model import INIT_PROMPT, MODELS
+from utils.router import create_communicator
 from utils.processor import ToolProcessor
 from utils.parser import Parser
+from utils.context import ContextManager
 from utils.prompts import ONLY_ONE_TOOL_PROMPT
-import json, os
+from utils.config import CONFIG
+from utils.lazy import LazyTool
+from utils.telemetry import TELEMETRY
+from utils.profiling import PROFILER
+from utils.console import verbosity
+from utils.batch import run_batch, BATCH
+import os, asyncio, argparse
 
 # -- Configuration --
-ACTIVATED_TOOLS = json.load(open("config.json", "r"))["ACTIVATED_TOOLS"]
-LLM_MODEL = json.load(open("config.json", "r"))["MODEL_CONFIG"]["LLM_MODEL"]
-TOOL_OUTPUTS = json.load(open("config.json", "r"))["TOOL_OUTPUTS"]
-THOUGHTS_IN_TERMINAL = json.load(open("config.json", "r"))["THOUGHTS_IN_TERMINAL"]
-AGENT_BASE_DIR = json.load(open("config.json", "r"))["AGENT_BASE_DIR"]
+ACTIVATED_TOOLS = CONFIG["ACTIVATED_TOOLS"]
+LLM_MODEL = CONFIG["MODEL_CONFIG"]["LLM_MODEL"]
+TOOL_OUTPUTS = CONFIG["TOOL_OUTPUTS"]
+THOUGHTS_IN_TERMINAL = CONFIG["THOUGHTS_IN_TERMINAL"]
+AGENT_BASE_DIR = CONFIG["AGENT_BASE_DIR"]
+PARALLEL_TOOLS = CONFIG["PARALLEL_TOOLS"]
+MAX_TOOL_WORKERS = CONFIG["MAX_TOOL_WORKERS"]
+STREAM_RESPONSES = CONFIG["STREAM_RESPONSES"]
+SHOW_TOKEN_COUNTS = CONFIG["CONTEXT"]["show_token_counts"]
 
 # -- Agent Class --
+# Every agent is one session with its own context and workspace (base_dir).
+# `activated_tools` and `database_path` default to the config.
+# `run` drives a task synchronously; `arun` does the same on an event loop, so
+# one process can drive many sessions while they wait for their LLM.
 class Agent:
-    def __init__(self):
-        self.llm = CreateCommunicator(LLM_MODEL)
-        file_editor = FileEditor() if ACTIVATED_TOOLS["file_editor"] else None
-        shell_executor = ShellExecutor() if ACTIVATED_TOOLS["shell_executor"] else None
-        ask_user = AskUser() if ACTIVATED_TOOLS["ask_user"] else None
-        wiki = WikiSearch() if ACTIVATED_TOOLS["wiki"] else None
-        image_analyzer = ImageAnalyzer()
-        database = Database()
-        self.tool_processor = ToolProcessor(file_editor, shell_executor, ask_user, wiki, image_analyzer, database)
+    def __init__(self, base_dir: str=AGENT_BASE_DIR, verbose: bool=True, activated_tools: dict=ACTIVATED_TOOLS, database_path: str | None=None):
+        self.base_dir = base_dir
+        self.verbose = verbose
+        self.activated_tools = activated_tools
+        self.llm = create_communicator("LLM", LLM_MODEL)
+        # Tools are built on their first use
+        file_editor = LazyTool(FileEditor, base_dir) if activated_tools["file_editor"] else None
+        shell_executor = LazyTool(ShellExecutor, base_dir=base_dir) if activated_tools["shell_executor"] else None
+        ask_user = LazyTool(AskUser) if activated_tools["ask_user"] else None
+        wiki = LazyTool(WikiSearch) if activated_tools["wiki"] else None
+        image_analyzer = LazyTool(ImageAnalyzer, base_dir) if activated_tools["image_analyzer"] else None
+        database = LazyTool(Database, database_path) if activated_tools["database"] else None
+        self.tool_processor = ToolProcessor(file_editor, shell_executor, ask_user, wiki, image_analyzer, database, PARALLEL_TOOLS, MAX_TOOL_WORKERS)
         self.parser = Parser()
         self.context = []
-        self.WAITER = Waiter()
         self.init_prompt = self._build_init_prompt()
+        self.context_manager = ContextManager(LLM_MODEL, self.llm, self.init_prompt)
+        # Models with `system_prompt` get the init prompt once as a (cached) system prompt
+        # instead of in front of every task; `warm_up` loads the model in the background
+        self.system_prompt = MODELS[LLM_MODEL].get("system_prompt", False)
+        if self.system_prompt:
+            self.llm.set_system_prompt(self.init_prompt)
+        if MODELS[LLM_MODEL].get("warm_up", False):
+            with verbosity(verbose):
+                self.llm.warm_up()
 
     # Build Initial Prompt
     def _build_init_prompt(self):
         prompt = INIT_PROMPT
-        prompt = prompt.replace("{file_editor_prompt}", FILE_EDITOR_PROMPT if ACTIVATED_TOOLS["file_editor"] else "")
-        prompt = prompt.replace("{shell_executor_prompt}", SHELL_EXECUTOR_PROMPT if ACTIVATED_TOOLS["shell_executor"] else "")
-        prompt = prompt.replace("{ask_user_prompt}", ASK_USER_PROMPT if ACTIVATED_TOOLS["ask_user"] else "")
-        prompt = prompt.replace("{wiki_prompt}", WIKI_PROMPT if ACTIVATED_TOOLS["wiki"] else "")
-        prompt = prompt.replace("{only_one_tool_prompt}", ONLY_ONE_TOOL_PROMPT if not any(ACTIVATED_TOOLS.values()) else "")
-        prompt = prompt.replace("{image_analyzer_prompt}", IMAGE_ANALYZER_PROMPT if ACTIVATED_TOOLS["image_analyzer"] else "")
-        prompt = prompt.replace("{database_prompt}", DATABASE_PROMPT if ACTIVATED_TOOLS["database"] else "")
+        prompt = prompt.replace("{file_editor_prompt}", FILE_EDITOR_PROMPT if self.activated_tools["file_editor"] else "")
+        prompt = prompt.replace("{shell_executor_prompt}", SHELL_EXECUTOR_PROMPT if self.activated_tools["shell_executor"] else "")
+        prompt = prompt.replace("{ask_user_prompt}", ASK_USER_PROMPT if self.activated_tools["ask_user"] else "")
+        prompt = prompt.replace("{wiki_prompt}", WIKI_PROMPT if self.activated_tools["wiki"] else "")
+        prompt = prompt.replace("{only_one_tool_prompt}", ONLY_ONE_TOOL_PROMPT if not any(self.activated_tools.values()) else "")
+        prompt = prompt.replace("{image_analyzer_prompt}", IMAGE_ANALYZER_PROMPT if self.activated_tools["image_analyzer"] else "")
+        prompt = prompt.replace("{database_prompt}", DATABASE_PROMPT if self.activated_tools["database"] else "")
         return prompt
 
     # Reset the Context of the Agent
     def reset_context(self):
         self.context = []
+        shell_executor = self.tool_processor.shell_executor
+        if shell_executor is not None and shell_executor.loaded:
+            shell_executor.reset()
 
-    def run(self, task: str, max_turns: int=40):
-        self.WAITER.wait_if_needed(LLM_MODEL)
-        print(f"======= Starting Task =======")
-        os.makedirs(AGENT_BASE_DIR, exist_ok=True)
-        prompt = self.init_prompt + task
+    def _print(self, text: str):
+        if self.verbose:
+            print(text)
 
-        for turn in range(max_turns):
-            print(f"\n--- Turn {turn + 1}/{max_turns} ---")
-            print("🤖 Agent is thinking...")
-            llm_response, self.context = self.llm.chat(prompt, self.context)
-            print(f"▶️ Agent Action:\n{llm_response if THOUGHTS_IN_TERMINAL else ''.join([f'⚙️ {_} \n' for _ in self.parser.extract_tagged_sections(llm_response)])}")
-            status, tool_output = self.tool_processor.process(llm_response)
-            if status == "FINISHED":
-                print("\n✅ Task Finished!")
-                print("===========================")
-                print(f"🏁 Final Result:\n→ {tool_output}")
-                print("===========================\n\n")
-                return
-            else: # status == "CONTINUE"
-                if TOOL_OUTPUTS:
-                    print(f"\n🛠️ Tool Output:\n{tool_output}")
-                prompt = tool_output
-        print("\n🚫 Task incomplete: Maximum turns reached.")
+    # -- Turn Helpers --
+    # Shared by run and arun; everything that talks to the LLM or runs tools stays in the loops.
+    def _start_task(self, task: str) -> str:
+        self._print(f"======= Starting Task =======")
+        os.makedirs(self.base_dir, exist_ok=True)
+        if self.system_prompt:
+            return task
+        return self.init_prompt + task
+
+    def _start_turn(self, turn: int, max_turns: int):
+        self._print(f"\n--- Turn {turn + 1}/{max_turns} ---")
+        self._print("🤖 Agent is thinking...")
+
+    def _record_turn(self, prompt: str, llm_response: str, llm_span):
+        token_counts = self.context_manager.record(self.context, self.llm.last_usage)
+        model_idx = getattr(self.llm, "model_idx", LLM_MODEL) # A router may have fallen back to another model
+        llm_span.set(model=model_idx, response_chars=len(llm_response), **token_counts)
+        TELEMETRY.count("agent_llm_prompt_chars_total", len(prompt), model=model_idx)
+        TELEMETRY.count("agent_llm_response_chars_total", len(llm_response), model=model_idx)
+        TELEMETRY.count("agent_llm_prompt_tokens_total", token_counts.get("prompt_tokens") or 0, model=model_idx)
+        TELEMETRY.count("agent_llm_response_tokens_total", token_counts.get("response_tokens") or 0, model=model_idx)
+        if SHOW_TOKEN_COUNTS:
+            self._print(f"📊 Tokens: {token_counts}")
+        self._print(f"▶️ Agent Action:\n{llm_response if THOUGHTS_IN_TERMINAL else ''.join([f'⚙️ {_} \n' for _ in self.parser.extract_tagged_sections(llm_response)])}")
+
+    # Returns True if the task is finished
+    def _finish_turn(self, status: str, tool_output: str) -> bool:
+        if status == "FINISHED":
+            self._print("\n✅ Task Finished!")
+            self._print("===========================")
+            self._print(f"🏁 Final Result:\n→ {tool_output}")
+            self._print("===========================\n\n")
+            return True
+        if TOOL_OUTPUTS: # status == "CONTINUE"
+            self._print(f"\n🛠️ Tool Output:\n{tool_output}")
+        return False
+
+    # Returns (status, result, turns); status is "FINISHED" or "INCOMPLETE"
+    def run(self, task: str, max_turns: int=40) -> tuple[str, str | None, int]:
+        prompt = self._start_task(task)
+
+        with verbosity(self.verbose), TELEMETRY.span("task", session=self.base_dir, task_chars=len(task)) as task_span:
+            for turn in range(max_turns):
+                with TELEMETRY.span("turn", turn=turn + 1), PROFILER.profile("turn", f"turn{turn + 1}", turn + 1):
+                    self._start_turn(turn, max_turns)
+                    with TELEMETRY.span("compact"):
+                        self.context = self.context_manager.compact(self.context)
+                    with TELEMETRY.span("llm", model=LLM_MODEL, prompt_chars=len(prompt)) as llm_span:
+                        if STREAM_RESPONSES:
+                            tool_stream = self.tool_processor.stream()
+                            try:
+                                llm_response, self.context = self.llm.chat(prompt, self.context, on_chunk=tool_stream.feed)
+                            except BaseException:
+                                tool_stream.abort()
+                                raise
+                        else:
+                            llm_response, self.context = self.llm.chat(prompt, self.context)
+                        self._record_turn(prompt, llm_response, llm_span)
+                    with TELEMETRY.span("tools"):
+                        if STREAM_RESPONSES:
+                            status, tool_output = tool_stream.finish()
+                        else:
+                            status, tool_output = self.tool_processor.process(llm_response)
+                    if self._finish_turn(status, tool_output):
+                        task_span.set(status=status, turns=turn + 1)
+                        return status, tool_output, turn + 1
+                    prompt = tool_output
+            task_span.set(status="INCOMPLETE", turns=max_turns)
+        self._print("\n🚫 Task incomplete: Maximum turns reached.")
+        return "INCOMPLETE", None, max_turns
+
+    # Async variant of run: the LLM call is awaited, tools and context
+    # compaction (which may call the LLM synchronously) run in worker threads
+    async def arun(self, task: str, max_turns: int=40) -> tuple[str, str | None, int]:
+        prompt = self._start_task(task)
+
+        with verbosity(self.verbose), TELEMETRY.span("task", session=self.base_dir, task_chars=len(task)) as task_span:
+            for turn in range(max_turns):
+                # No turn profiles: other sessions run on the same event loop during every await
+                with TELEMETRY.span("turn", turn=turn + 1):
+                    self._start_turn(turn, max_turns)
+                    with TELEMETRY.span("compact"):
+                        self.context = await asyncio.to_thread(self.context_manager.compact, self.context)
+                    with TELEMETRY.span("llm", model=LLM_MODEL, prompt_chars=len(prompt)) as llm_span:
+                        if STREAM_RESPONSES:
+                            tool_stream = self.tool_processor.stream()
+                            try:
+                                llm_response, self.context = await self.llm.achat(prompt, self.context, on_chunk=tool_stream.feed)
+                            except BaseException:
+                                tool_stream.abort()
+                                raise
+                        else:
+                            llm_response, self.context = await self.llm.achat(prompt, self.context)
+                        self._record_turn(prompt, llm_response, llm_span)
+                    with TELEMETRY.span("tools"):
+                        if STREAM_RESPONSES:
+                            status, tool_output = await asyncio.to_thread(tool_stream.finish)
+                        else:
+                            status, tool_output = await asyncio.to_thread(self.tool_processor.process, llm_response)
+                    if self._finish_turn(status, tool_output):
+                        task_span.set(status=status, turns=turn + 1)
+                        return status, tool_output, turn + 1
+                    prompt = tool_output
+            task_span.set(status="INCOMPLETE", turns=max_turns)
+        self._print("\n🚫 Task incomplete: Maximum turns reached.")
+        return "INCOMPLETE", None, max_turns
 
 # -- Main --
 if __name__ == "__main__":
-    agent = Agent()
-    while True:
-        task = input("Enter your task for the agent: ")
-        if task.lower() == "exit":
-            agent = None
-            break
-        elif task.lower() == "reset":
-            agent.reset_context()
-        else:
-            agent.run(task)
\ No newline at end of file
+    arguments = argparse.ArgumentParser(description="Run the agent interactively, or a batch of tasks with --batch.")
+    arguments.add_argument("--batch", metavar="TASKS", help="JSONL file with one task per line: {\"id\": ..., \"task\": ...}")
+    arguments.add_argument("--out", metavar="RESULTS", help="JSONL file the results are appended to (default: TASKS.results.jsonl)")
+    arguments.add_argument("--workers", type=int, default=BATCH["workers"], help="number of worker processes")
+    arguments.add_argument("--sandbox", default=BATCH["sandbox_dir"], help="directory for the per-task workspaces")
+    args = arguments.parse_args()
+    if args.batch:
+        run_batch(args.batch, args.out or os.path.splitext(args.batch)[0] + ".results.jsonl", args.workers, args.sandbox)
+    else:
+        agent = Agent()
+        while True:
+            task = input("Enter your task for the agent: ")
+            if task.lower() == "exit":
+                agent = None
+                break
+            elif task.lower() == "reset":
+                agent.reset_context()
+            else:
+                agent.run(task)
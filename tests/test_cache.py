@@ -0,0 +1,60 @@
+import time
+import pytest
+from utils.cache import TwoTierCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+def test_memory_hit_and_miss():
+    cache = TwoTierCache(memory_entries=4)
+    assert cache.get(("a",)) is None
+    cache.set(("a",), {"value": 1})
+    assert cache.get(("a",)) == {"value": 1}
+    assert cache.stats == {"memory_hits": 1, "disk_hits": 0, "misses": 1}
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = TwoTierCache(memory_entries=2)
+    cache.set(("a",), 1)
+    cache.set(("b",), 2)
+    cache.get(("a",)) # "b" is now the least recently used
+    cache.set(("c",), 3)
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == 1
+    assert cache.get(("c",)) == 3
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    TwoTierCache(path).set(("page", "en", "Python"), {"summary": "A language"})
+    cache = TwoTierCache(path)
+    assert cache.get(("page", "en", "Python")) == {"summary": "A language"}
+    assert cache.get(("page", "en", "Python")) == {"summary": "A language"}
+    assert cache.stats == {"memory_hits": 1, "disk_hits": 1, "misses": 0}
+
+def test_disk_tier_evicts_least_recently_used(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    cache = TwoTierCache(path, memory_entries=1, disk_entries=2)
+    cache.set(("a",), 1)
+    clock[0] += 1
+    cache.set(("b",), 2)
+    clock[0] += 1
+    assert cache.get(("a",)) == 1 # From disk, "b" is now the least recently used
+    clock[0] += 1
+    cache.set(("c",), 3)
+    cache = TwoTierCache(path)
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == 1
+    assert cache.get(("c",)) == 3
+
+def test_expired_entries_are_missing_in_both_tiers(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    cache = TwoTierCache(path, ttl=60)
+    cache.set(("a",), 1)
+    clock[0] += 59
+    assert cache.get(("a",)) == 1
+    clock[0] += 2
+    assert cache.get(("a",)) is None
+    assert TwoTierCache(path, ttl=60).get(("a",)) is None
+    assert cache.stats["misses"] == 1
@@ -0,0 +1,61 @@
+import os
+import pytest
+from tools.Database import Database, ENGINES
+
+# A fresh engine on the same file, as after a restart
+def reopen(path: str) -> Database:
+    ENGINES.pop(os.path.abspath(path)).close()
+    return Database(path)
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "data.json")
+    yield Database(path)
+    engine = ENGINES.pop(os.path.abspath(path), None)
+    if engine is not None:
+        engine.close()
+
+def test_batch_applies_writes_and_reads(database):
+    results = database.batch([
+        {"action": "write", "path": "user/theme", "content": "dark"},
+        {"action": "read", "path": "user/theme"},
+        {"action": "list", "path": "user"},
+    ])
+    assert results[0] == "Data successfully written."
+    assert results[1] == "dark"
+    assert reopen(database.path).read("user/theme") == "dark"
+
+def test_batch_rolls_back_on_conflicting_write(database):
+    database.write("old", "user/theme")
+    result = database.batch([
+        {"action": "write", "path": "x/y", "content": "1"},
+        {"action": "write", "path": "user/theme", "content": "new"},
+    ])
+    assert result.startswith("Error: Batch aborted at operation 1")
+    assert database.read("x/y") == "Error: Path not found."
+    assert database.read("user/theme") == "old"
+
+@pytest.mark.parametrize("operations", [
+    [{"action": "write", "path": "x/y", "content": "1"}, {"action": "write", "path": "z"}],
+    [{"action": "write", "path": "x/y", "content": "1"}, {"action": "read"}],
+    [{"action": "write", "path": "x/y", "content": "1"}, "not an operation"],
+    {"action": "write", "path": "x/y", "content": "1"},
+])
+def test_malformed_batch_changes_nothing(database, operations):
+    result = database.batch(operations)
+    assert isinstance(result, str) and result.startswith("Error:")
+    assert database.read("x/y") == "Error: Path not found."
+    assert reopen(database.path).read("x/y") == "Error: Path not found."
+
+# Two engines on one file, as in two agent processes
+def test_engines_on_one_file_keep_each_others_writes(database):
+    ENGINES.pop(os.path.abspath(database.path))
+    other = Database(database.path)
+    database.write("a", "notes/A")
+    other.write("b", "notes/B")
+    assert sorted(database.list("notes")) == ["A", "B"]
+    database.engine.compact()
+    other.write("c", "notes/C")
+    database.engine.close()
+    other.engine.close()
+    assert sorted(reopen(database.path).list("notes")) == ["A", "B", "C"]
@@ -0,0 +1,16 @@
+import pytest
+from utils import ratelimit
+from utils.ratelimit import RateLimiter
+
+@pytest.fixture
+def limiter(tmp_path, monkeypatch):
+    monkeypatch.setitem(ratelimit.MODELS, "big", {"rate_limit": [60, 500]})
+    return RateLimiter(str(tmp_path))
+
+def test_large_state_file_keeps_the_limit(limiter):
+    granted = sum(limiter.try_acquire("big") == 0 for _ in range(2000))
+    assert granted == 500
+
+def test_broken_state_file_does_not_grant_a_full_quota(limiter, tmp_path):
+    (tmp_path / "big.json").write_text("{broken")
+    assert limiter.try_acquire("big") > 0
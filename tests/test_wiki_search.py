@@ -0,0 +1,104 @@
+import pytest
+import tools.WikiSearch as wiki_search
+
+# -- Stand-In For The wikipedia Module --
+# Records every lookup, so the tests can tell cache hits from network calls
+class FakeWikipedia:
+    class exceptions:
+        class PageError(Exception):
+            pass
+
+        class DisambiguationError(Exception):
+            def __init__(self, title: str, options: list):
+                super().__init__(title)
+                self.options = options
+
+    def __init__(self):
+        self.language = "en"
+        self.calls = []
+
+    def set_lang(self, language: str):
+        self.language = language
+
+    def search(self, query: str) -> list:
+        self.calls.append(("search", self.language, query))
+        return [] if query == "nothing" else [query.title()]
+
+    def page(self, title: str, auto_suggest: bool=True):
+        if title == "Mercury":
+            raise self.exceptions.DisambiguationError(title, ["Mercury (planet)", "Mercury (element)"])
+        wikipedia = self
+        class Page:
+            @property
+            def summary(self):
+                wikipedia.calls.append(("summary", wikipedia.language, title))
+                return f"Summary of {title} ({wikipedia.language})"
+
+            @property
+            def content(self):
+                wikipedia.calls.append(("content", wikipedia.language, title))
+                return f"Content of {title}"
+        return Page()
+
+# Answers with the scripted responses instead of a model
+class ScriptedLLM:
+    def __init__(self, responses: list):
+        self.responses = responses
+        self.prompts = []
+
+    def chat(self, message: str, context: list) -> tuple[str, list]:
+        self.prompts.append(message)
+        return self.responses.pop(0), context
+
+@pytest.fixture
+def wikipedia(monkeypatch):
+    fake = FakeWikipedia()
+    monkeypatch.setattr(wiki_search, "wikipedia", fake)
+    monkeypatch.setattr(wiki_search, "LANGUAGE_GATE", wiki_search.LanguageGate())
+    return fake
+
+@pytest.fixture
+def make_search(monkeypatch, tmp_path):
+    def make(responses: list=()):
+        llm = ScriptedLLM(list(responses))
+        monkeypatch.setattr(wiki_search, "create_communicator", lambda role, model_idx: llm)
+        monkeypatch.setitem(wiki_search.WIKI_CACHE, "path", str(tmp_path / "wiki.sqlite"))
+        return wiki_search.WikiSearch(), llm
+    return make
+
+def test_summary_is_cached_per_language(wikipedia, make_search):
+    search, _ = make_search()
+    assert search.search("python", "en") == "Result from Wikipedia-Search: Summary of Python (en)"
+    assert search.search("python", "en") == "Result from Wikipedia-Search: Summary of Python (en)"
+    assert search.search("python", "de") == "Result from Wikipedia-Search: Summary of Python (de)"
+    assert wikipedia.calls == [
+        ("search", "en", "python"), ("summary", "en", "Python"),
+        ("search", "de", "python"), ("summary", "de", "Python"),
+    ]
+
+def test_cache_is_shared_through_disk(wikipedia, make_search):
+    make_search()[0].search("python", "en")
+    search, _ = make_search()
+    assert search.search("python", "en") == "Result from Wikipedia-Search: Summary of Python (en)"
+    assert len(wikipedia.calls) == 2
+    assert search.cache.stats["disk_hits"] == 2
+
+def test_no_results(wikipedia, make_search):
+    search, _ = make_search()
+    assert search.search("nothing", "en") == "Error: No Wikipedia search results found for 'nothing'."
+
+def test_summary_and_content_share_one_page_entry(wikipedia, make_search):
+    search, llm = make_search([
+        "<<<SET_LANG:'en'>>><<<GET_SUMMARY:'Python'>>>",
+        "<<<GET_PAGE_CONTENT:'Python'>>>",
+        "<<<GET_SUMMARY:'Python'>>>",
+        "<<<WIKI_RESULT:'Python is a language.'>>>",
+    ])
+    assert search.search("python", "en", "one sentence") == "Result from Wikipedia-Search: Python is a language."
+    assert wikipedia.calls == [("summary", "en", "Python"), ("content", "en", "Python")]
+    assert "Content of Python" in llm.prompts[2]
+
+def test_disambiguation_falls_back_to_the_wiki_llm(wikipedia, make_search):
+    search, llm = make_search(["<<<WIKI_RESULT:'Mercury is a planet.'>>>"])
+    assert search.search("mercury", "en") == "Result from Wikipedia-Search: Mercury is a planet."
+    assert len(llm.prompts) == 1
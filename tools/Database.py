@@ -1,5 +1,12 @@
 # -- Importing Packages --
-import json, os
+import json, os, threading, atexit
+from contextlib import contextmanager
+from utils.config import CONFIG
+
+try:
+    import fcntl
+except ImportError: # No lock files on this platform, only one process may use a database file
+    fcntl = None
 
 # -- Database Prompt --
 DATABASE_PROMPT = """
@@ -14,6 +21,9 @@ DATABASE_PROMPT = """
     * **List**: `<<<DATA:'list'<nex!-pr-amtre?gr+>'path_to_container'>>>`
         * **'path_to_container'**: The path to a directory/container whose contents you want to list (e.g., "settings/api"). If the path points directly to content (not a container) or does not exist, an error will be returned. Use `''` (empty string) to list the root level.
         * **Example**: `<<<DATA:'list'<nex!-pr-amtre?gr+>'settings/api'>>>`
+    * **Batch**: `<<<DATA:'batch'<nex!-pr-amtre?gr+>'operations'>>>`
+        * **'operations'**: A JSON list of operations, each with an "action" ("read", "write" or "list") and the same arguments as above ("path", and "content" for writes). The results are returned as a list in the same order. If one write fails, no write of the batch is stored.
+        * **Example**: `<<<DATA:'batch'<nex!-pr-amtre?gr+>'[{"action": "write", "content": "dark", "path": "user/theme"}, {"action": "list", "path": "user"}]'>>>`
     * **INFO**: This tool is crucial for your operation and learning. It should be used for:
         * **Logging**: Storing various types of logs, including system events, operational details, and especially **errors** for later retrieval and analysis. This helps in debugging and understanding past issues.
         * **Memory/User Context**: Remembering specific details for the user, such as preferences or previous conversation points.
@@ -22,90 +32,280 @@ DATABASE_PROMPT = """
     * **PATHS**: "context/{topic}": Use this for 
 """
 
-# -- Database Class --
+# -- Storage Engine Class --
+# Keeps the whole tree in memory. Writes are appended to a journal next to the
+# snapshot file and folded into the snapshot every `compact_every` entries.
+# Every access holds an flock on the journal and first replays the entries other
+# processes appended since, so several agents can share one database file.
+class StorageEngine:
+    def __init__(self, path: str, compact_every: int=100):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.compact_every = compact_every
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.data = None
+        self.snapshot_id = None
+        self.journal = open(self.journal_path, "ab")
+        with self.locked(): # Load the snapshot and replay the journal on top of it
+            pass
+        atexit.register(self.close)
 
-class Database:
-    def __init__(self):
+    # Hold the thread and file locks and catch up with other processes.
+    # Nested calls from the same thread only take the locks once.
+    @contextmanager
+    def locked(self):
+        with self.lock:
+            if self.depth == 0:
+                if fcntl is not None:
+                    fcntl.flock(self.journal.fileno(), fcntl.LOCK_EX)
+                try:
+                    self._sync()
+                except Exception:
+                    self._unlock()
+                    raise
+            self.depth += 1
+            try:
+                yield self.data
+            finally:
+                self.depth -= 1
+                if self.depth == 0:
+                    self._unlock()
+
+    def _unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self.journal.fileno(), fcntl.LOCK_UN)
+
+    # Identifies the snapshot file, it changes whenever a process compacts
+    def _snapshot_id(self):
         try:
-            self.path = json.load(open("config.json", "r"))["DATABASE_PATH"]
+            stat = os.stat(self.path)
         except FileNotFoundError:
-            raise ValueError("config.json not found.")
-        except json.JSONDecodeError:
-            raise ValueError("Error decoding config.json.")
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
 
-        try:
-            with open(self.path, "r") as f:
-                json.load(f)
-        except json.JSONDecodeError:
-            raise ValueError("The database file is not valid JSON.")
+    # Reload after a compaction by another process, then apply new journal entries
+    def _sync(self):
+        snapshot_id = self._snapshot_id()
+        if self.data is None or snapshot_id != self.snapshot_id or os.path.getsize(self.journal_path) < self.journal_offset:
+            try:
+                with open(self.path, "r") as f:
+                    self.data = json.load(f)
+            except FileNotFoundError:
+                self.data = {}
+            except json.JSONDecodeError:
+                raise ValueError("The database file is not valid JSON.")
+            self.snapshot_id = snapshot_id
+            self.journal_offset = 0
+            self.journal_entries = 0
+        self._replay()
 
-    def _load_data(self):
-        try:
-            with open(self.path, "r") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+    # Apply the journal entries after `journal_offset`
+    def _replay(self):
+        valid_bytes = self.journal_offset
+        with open(self.journal_path, "rb") as f:
+            f.seek(self.journal_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break # Torn write from a crash
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                self._apply(self.data, entry)
+                self.journal_entries += 1
+                valid_bytes += len(line)
+        if valid_bytes != os.path.getsize(self.journal_path):
+            os.truncate(self.journal_path, valid_bytes)
+        self.journal_offset = valid_bytes
 
-    def _save_data(self, data):
-        with open(self.path, "w") as f:
-            json.dump(data, f, indent=4)
+    # Apply a journal entry (idempotent, so replaying after a compaction is safe)
+    def _apply(self, data: dict, entry: dict):
+        if entry["op"] == "write":
+            current_level = data
+            for part in entry["path"][:-1]:
+                current_level = current_level.setdefault(part, {})
+            current_level[entry["path"][-1]] = entry["content"]
+        elif entry["op"] == "batch":
+            for write_entry in entry["writes"]:
+                self._apply(data, write_entry)
 
-    def write(self, content: str, path: str):
-        db = self._load_data()
-        path_parts = path.split('/')
-        current_level = db
+    # Append an entry to the journal and flush it to disk
+    def log(self, entry: dict):
+        with self.locked():
+            line = json.dumps(entry).encode("utf-8") + b"\n"
+            self.journal.write(line)
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            self.journal_offset += len(line)
+            self.journal_entries += 1
+            if self.journal_entries >= self.compact_every:
+                self.compact()
+
+    # Write the in-memory tree to a new snapshot and clear the journal
+    def compact(self):
+        with self.locked():
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.journal.truncate(0)
+            self.journal.seek(0)
+            self.snapshot_id = self._snapshot_id()
+            self.journal_offset = 0
+            self.journal_entries = 0
 
+    def close(self):
+        with self.lock:
+            if self.journal.closed:
+                return
+            with self.locked():
+                if self.journal_entries:
+                    self.compact()
+            self.journal.close()
+            atexit.unregister(self.close)
+
+ENGINES = {}
+ENGINES_LOCK = threading.Lock()
+
+# Share one engine per database file inside a process
+def get_engine(path: str, compact_every: int=100) -> StorageEngine:
+    key = os.path.abspath(path)
+    with ENGINES_LOCK:
+        if key not in ENGINES:
+            ENGINES[key] = StorageEngine(path, compact_every)
+        return ENGINES[key]
+
+# -- Database Class --
+
+class Database:
+    def __init__(self, path: str | None=None):
+        self.path = path or CONFIG["DATABASE_PATH"]
+        compact_every = CONFIG.get("DATABASE_COMPACT_EVERY", 100)
+        self.engine = get_engine(self.path, compact_every)
+
+    # Check if a write to the path is allowed, returns an error or None
+    def _check_write(self, path_parts: list[str]):
+        current_level = self.engine.data
         for i, part in enumerate(path_parts):
             if i == len(path_parts) - 1: # Last part is the data name
                 if part in current_level:
                     return "Error: Path already exists. Cannot overwrite."
-                current_level[part] = content
+            elif part in current_level and not isinstance(current_level[part], dict):
+                return "Error: Path conflicts with existing content. Cannot create nested structure."
             else:
-                if part not in current_level:
-                    current_level[part] = {}
-                elif not isinstance(current_level[part], dict):
-                    return "Error: Path conflicts with existing content. Cannot create nested structure."
-                current_level = current_level[part]
-        self._save_data(db)
+                current_level = current_level.get(part, {})
+        return None
+
+    def write(self, content: str, path: str):
+        path_parts = path.split('/')
+        with self.engine.locked():
+            error = self._check_write(path_parts)
+            if error:
+                return error
+            entry = {"op": "write", "path": path_parts, "content": content}
+            self.engine._apply(self.engine.data, entry)
+            self.engine.log(entry)
         return "Data successfully written."
 
+    # Reject a malformed batch before anything is applied
+    def _check_batch(self, operations) -> str | None:
+        if not isinstance(operations, list):
+            return "Error: Batch operations must be a JSON list."
+        for i, operation in enumerate(operations):
+            if not isinstance(operation, dict):
+                return f"Error: Batch operation {i} is not an object, no data was written."
+            if not isinstance(operation.get("path"), str):
+                return f"Error: Batch operation {i} has no 'path', no data was written."
+            if operation.get("action") == "write" and not isinstance(operation.get("content"), str):
+                return f"Error: Batch operation {i} writes no 'content', no data was written."
+        return None
+
+    # Apply read, write and list operations as one transaction with a single journal entry
+    def batch(self, operations: list):
+        error = self._check_batch(operations)
+        if error:
+            return error
+        results = []
+        writes = []
+        created = [] # (container, key) pairs to roll back if a write fails
+        with self.engine.locked():
+            try:
+                for i, operation in enumerate(operations):
+                    action = operation.get("action")
+                    if action == "write":
+                        path_parts = operation["path"].split('/')
+                        error = self._check_write(path_parts)
+                        if error:
+                            self._rollback(created)
+                            return f"Error: Batch aborted at operation {i}, no data was written. {error}"
+                        current_level = self.engine.data
+                        for part in path_parts[:-1]:
+                            if part not in current_level:
+                                current_level[part] = {}
+                                created.append((current_level, part))
+                            current_level = current_level[part]
+                        current_level[path_parts[-1]] = operation["content"]
+                        created.append((current_level, path_parts[-1]))
+                        writes.append({"op": "write", "path": path_parts, "content": operation["content"]})
+                        results.append("Data successfully written.")
+                    elif action == "read":
+                        results.append(self.read(operation["path"]))
+                    elif action == "list":
+                        results.append(self.list(operation["path"]))
+                    else:
+                        results.append(f"Error: Unknown batch action '{action}'.")
+            except Exception:
+                self._rollback(created) # Memory must not hold writes the journal doesn't
+                raise
+            if writes:
+                self.engine.log({"op": "batch", "writes": writes})
+        return results
+
+    def _rollback(self, created: list):
+        for container, key in reversed(created):
+            del container[key]
+        created.clear()
+
     def read(self, path: str):
-        db = self._load_data()
         path_parts = path.split('/')
-        current_level = db
+        with self.engine.locked():
+            current_level = self.engine.data
 
-        for i, part in enumerate(path_parts):
-            if part not in current_level:
-                return "Error: Path not found."
-            if i == len(path_parts) - 1: # Last part
-                return current_level[part]
-            
-            if not isinstance(current_level[part], dict):
-                return "Error: Path points to content, not a container." # If an intermediate part is not a dict
-            current_level = current_level[part]
+            for i, part in enumerate(path_parts):
+                if part not in current_level:
+                    return "Error: Path not found."
+                if i == len(path_parts) - 1: # Last part
+                    return current_level[part]
+
+                if not isinstance(current_level[part], dict):
+                    return "Error: Path points to content, not a container." # If an intermediate part is not a dict
+                current_level = current_level[part]
         return "Error: Path not found." # Should not be reached if path is valid
 
     def list(self, path: str):
-        db = self._load_data()
-        path_parts = path.split('/')
-        current_level = db
+        with self.engine.locked():
+            # If the path is empty or leads to the root
+            if path == "":
+                return list(self.engine.data.keys())
 
-        for i, part in enumerate(path_parts):
-            if part not in current_level:
-                return "Error: Path not found."
-            
-            if i == len(path_parts) - 1: # Last part
-                if isinstance(current_level[part], dict):
-                    return list(current_level[part].keys())
-                else:
-                    return "Error: Path points directly to content, not a listable container."
-            
-            if not isinstance(current_level[part], dict):
-                return "Error: Intermediate path element is not a dictionary."
-            current_level = current_level[part]
-        
-        # If the path is empty or leads to the root
-        if not path_parts or path == "":
-             return list(db.keys())
-
-        return "Error: Path not found or unexpected structure." # Fallback for unhandled cases
\ No newline at end of file
+            path_parts = path.split('/')
+            current_level = self.engine.data
+
+            for i, part in enumerate(path_parts):
+                if part not in current_level:
+                    return "Error: Path not found."
+
+                if i == len(path_parts) - 1: # Last part
+                    if isinstance(current_level[part], dict):
+                        return list(current_level[part].keys())
+                    else:
+                        return "Error: Path points directly to content, not a listable container."
+
+                if not isinstance(current_level[part], dict):
+                    return "Error: Intermediate path element is not a dictionary."
+                current_level = current_level[part]
+
+        return "Error: Path not found or unexpected structure." # Fallback for unhandled cases
@@ -1,34 +1,180 @@
-import os, json
+import os, json, re, fnmatch, itertools
+from utils.config import CONFIG
 
 # -- Configuration --
-AGENT_BASE_DIR = json.load(open("config.json", "r"))["AGENT_BASE_DIR"]
+AGENT_BASE_DIR = CONFIG["AGENT_BASE_DIR"]
+FILE_LIST = CONFIG["FILE_LIST"]
 
 # -- File Editor Prompt --
 FILE_EDITOR_PROMPT = """
-**File Editor**: Read, write, append, and list files from your workspace.
-    * **Read**: `<<<FILE:'read'<nex!-pr-amtre?gr+>'path/to/file.txt'>>>`
+**File Editor**: Read, write, append, edit, and list files from your workspace.
+    * **Read**: `<<<FILE:'read'<nex!-pr-amtre?gr+>'path/to/file.txt'>>>`. For large files read only a window: `<<<FILE:'read'<nex!-pr-amtre?gr+>'path/to/file.txt'<nex!-pr-amtre?gr+>'120:180'>>>` reads lines 120 to 180 (`'120:'` to the end, `'b0:4096'` reads bytes). The output tells you the total number of lines.
     * **Write**: `<<<FILE:'write'<nex!-pr-amtre?gr+>'path/to/file.txt'<nex!-pr-amtre?gr+>'content_to_write'>>>` (overwrites file)
     * **Append**: `<<<FILE:'append'<nex!-pr-amtre?gr+>'path/to/file.txt'<nex!-pr-amtre?gr+>'content_to_append'>>>`
-    * **List**: `<<<FILE:'list'<nex!-pr-amtre?gr+>'path/to/directory'<nex!-pr-amtre?gr+>'mode'<nex!-pr-amtre?gr+>'contents'>>>` (use `'.'` for the current directory. example: `<<<FILE:'list'<nex!-pr-amtre?gr+>'.'>>>`). modes: `ls`(d, lists only the path), `lsc'(lists the path recursively). contents is a list with 4 params; the first is if the size of files/dictories should be shown, the second is if the type(file/directory) should be shown, the third is if the content should be shown, and the fourth is the maxlength of the content(in charakters).
+    * **Edit**: `<<<FILE:'edit'<nex!-pr-amtre?gr+>'path/to/file.txt'<nex!-pr-amtre?gr+>'exact text to find'<nex!-pr-amtre?gr+>'replacement text'>>>` replaces text that occurs exactly once in the file (include some surrounding lines to make it unique, or add `<nex!-pr-amtre?gr+>'all'` to replace every occurrence). Prefer this over rewriting a whole file.
+    * **Patch**: `<<<FILE:'patch'<nex!-pr-amtre?gr+>'path/to/file.txt'<nex!-pr-amtre?gr+>'unified diff'>>>` applies the hunks (`@@ -start,count +start,count @@` followed by lines starting with ` `, `-` or `+`) of a unified diff to this one file.
+    * **List**: `<<<FILE:'list'<nex!-pr-amtre?gr+>'path/to/directory'<nex!-pr-amtre?gr+>'mode'<nex!-pr-amtre?gr+>'contents'>>>` (use `'.'` for the current directory. example: `<<<FILE:'list'<nex!-pr-amtre?gr+>'.'>>>`). modes: `ls`(d, lists only the path), `lsc'(lists the path recursively). contents is a list with 4 params; the first is if the size of files/dictories should be shown, the second is if the type(file/directory) should be shown, the third is if the content should be shown, and the fourth is the maxlength of the content(in charakters). An optional fifth argument limits how many directory levels `lsc` descends (e.g. `'2'`). Entries matched by .gitignore and folders like node_modules or venv are left out; very large listings are cut off.
     * **Example**: `<<<FILE:'read'<nex!-pr-amtre?gr+>'data.txt'>>>`, `<<<FILE:'write'<nex!-pr-amtre?gr+>'data.txt'<nex!-pr-amtre?gr+>'Hello World!'>>>`, `<<<FILE:'list'<nex!-pr-amtre?gr+>'.'<nex!-pr-amtre?gr+>'ls'<nex!-pr-amtre?gr+>'[True, False, True, 100]'>>>`.
     * **IMPORTANT**: Never use a backslash for a quote or before a quote if not needed for something special.
     * **Info**: if you want to write a literal backslash (`\`) to a file(so that the backslash is like any other character), use <bs> instead. Don't use this for newlines. NEVER!! Use `\n` for newlines. This counts for every newsline in every file_format.
 """
 
+# -- Ignore Rules --
+# .gitignore style patterns as (base, match, negate, dir_only, anchored) tuples.
+# Anchored patterns match the path relative to `base`, the others the entry name;
+# the last matching rule decides.
+def parse_ignore_patterns(lines: list, base: str="") -> list:
+    rules = []
+    for line in lines:
+        pattern = line.rstrip("\n").rstrip()
+        if not pattern or pattern.startswith("#"):
+            continue
+        negate = pattern.startswith("!")
+        pattern = pattern.lstrip("!")
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        while pattern.startswith("**/"):
+            pattern = pattern[3:]
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        if pattern:
+            rules.append((base, re.compile(fnmatch.translate(pattern)).match, negate, dir_only, anchored))
+    return rules
+
+def load_gitignore(dir_path: str, rel_dir: str) -> list:
+    if not FILE_LIST["use_gitignore"]:
+        return []
+    try:
+        with open(os.path.join(dir_path, ".gitignore"), "r", encoding="utf-8") as file:
+            return parse_ignore_patterns(file.readlines(), rel_dir)
+    except OSError:
+        return []
+
+def is_ignored(rules: list, rel_path: str, name: str, is_dir: bool) -> bool:
+    ignored = False
+    for base, match, negate, dir_only, anchored in rules:
+        if (dir_only and not is_dir) or not rel_path.startswith(base):
+            continue
+        if match(rel_path[len(base):] if anchored else name):
+            ignored = not negate
+    return ignored
+
+DEFAULT_IGNORE_RULES = parse_ignore_patterns(FILE_LIST["ignore"])
+
+# -- Unified Diff Helpers --
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,(\d+))? @@")
+
+# "+++ b/src/app.py\t2024-01-01 ..." -> "src/app.py"
+def header_path(line: str) -> str:
+    path = line[4:].split("\t")[0].strip()
+    return path[2:] if path.startswith(("a/", "b/")) else path
+
+# Split a unified diff into hunks of (old_start, old_lines, new_lines). File
+# headers are skipped wherever they appear; a diff of more than one file raises
+# ValueError, since a patch applies to one file. "--- x" and "+++ x" are only
+# headers once the line counts of the hunk header are used up, before that they
+# are a removed "-- x" or an added "++ x" line.
+def parse_hunks(diff: str) -> list:
+    hunks = []
+    files = set()
+    in_header = True
+    old_left = new_left = 0
+    lines = diff.split("\n")
+    while lines and lines[-1] == "":
+        lines.pop()
+    for line in lines:
+        header = HUNK_HEADER.match(line)
+        if header:
+            hunks.append((int(header.group(1)), [], []))
+            old_left, new_left = int(header.group(2) or 1), int(header.group(3) or 1)
+            in_header = False
+            continue
+        if line.startswith("diff ") or (line.startswith(("--- ", "+++ ")) and old_left <= 0 and new_left <= 0):
+            in_header = True
+            if line.startswith("+++ ") and header_path(line) != "/dev/null":
+                files.add(header_path(line))
+                if len(files) > 1:
+                    raise ValueError(f"The diff changes more than one file ({', '.join(sorted(files))}). Patch one file at a time.")
+        elif in_header or line.startswith("\\"): # Text before a hunk, "\ No newline at end of file"
+            continue
+        elif line.startswith("-"):
+            hunks[-1][1].append(line[1:])
+            old_left -= 1
+        elif line.startswith("+"):
+            hunks[-1][2].append(line[1:])
+            new_left -= 1
+        else: # Context line; some tools drop the space of empty ones
+            hunks[-1][1].append(line[1:])
+            hunks[-1][2].append(line[1:])
+            old_left -= 1
+            new_left -= 1
+    return hunks
+
+# Find `block` in `lines` at or after `start`, as close to `expected` as possible
+def find_block(lines: list, block: list, expected: int, start: int) -> int:
+    if not block:
+        return min(max(expected, start), len(lines))
+    last = len(lines) - len(block)
+    for distance in itertools.count():
+        below, above = expected - distance, expected + distance
+        if below < start and above > last:
+            return -1
+        for position in (below, above):
+            if start <= position <= last and lines[position:position + len(block)] == block:
+                return position
+
 # -- File Editor Class --
 class FileEditor:
+    def __init__(self, base_dir: str=AGENT_BASE_DIR):
+        self.base_dir = base_dir
+
     # Helper Function
     def _get_agent_path(self, file_path: str=".") -> str:
         # Prevent directory traversal attacks
         sanitized_path = os.path.normpath(file_path).lstrip('./\\')
-        return os.path.join(AGENT_BASE_DIR, sanitized_path)
+        return os.path.join(self.base_dir, sanitized_path)
+
+    # Undo the escaping models use for tool arguments
+    def _unescape(self, content: str) -> str:
+        content = content.replace("\\'", "'")
+        content = content.replace('\\"', '"')
+        content = content.replace("\\n", "\n")
+        content = content.replace("\\t", "\t")
+        return content.replace("<bs>", "\\")
 
     # Read Tool
-    def read(self, file_path: str=".") -> str:
+    # An optional window reads lines "start:end" (1-based, inclusive) or bytes
+    # "bstart:end"; the file is streamed, only the window is kept.
+    def read(self, file_path: str=".", window: str="") -> str:
         try:
             full_path = self._get_agent_path(file_path)
+            if not window:
+                with open(full_path, 'r', encoding='utf-8') as file:
+                    return f"Content of file at {file_path} is:\n{file.read()}"
+            by_bytes = window.startswith("b")
+            start, separator, end = window.lstrip("b").partition(":")
+            if not separator:
+                end = start
+            if by_bytes:
+                start, end = int(start or 0), int(end) if end else None
+                with open(full_path, 'rb') as file:
+                    file.seek(start)
+                    data = file.read(end - start if end is not None else -1)
+                    file.seek(0)
+                    total_lines = sum(chunk.count(b"\n") for chunk in iter(lambda: file.read(1 << 20), b""))
+                    size = file.tell()
+                return f"Content of file at {file_path} (bytes {start}-{start + len(data)} of {size}, {total_lines} lines) is:\n{data.decode('utf-8', errors='replace')}"
+            start, end = max(int(start or 1), 1), int(end) if end else None
+            selected = []
+            total_lines = 0
             with open(full_path, 'r', encoding='utf-8') as file:
-                return f"Content of file at {file_path} is:\n{file.read()}"
+                for total_lines, line in enumerate(file, 1):
+                    if start <= total_lines and (end is None or total_lines <= end):
+                        selected.append(line)
+            last = min(end, total_lines) if end is not None else total_lines
+            if start > total_lines:
+                return f"Error: '{file_path}' has only {total_lines} lines."
+            return f"Content of file at {file_path} (lines {start}-{last} of {total_lines}) is:\n{''.join(selected)}"
 
         except FileNotFoundError:
             return f"Error: File not found at '{file_path}'."
@@ -39,13 +185,9 @@ class FileEditor:
     # Write Tool
     def write(self, file_path: str=".", content: str="") -> str:
         try:
-            content = content.replace("\\'", "'")
-            content = content.replace('\\"', '"')
-            content = content.replace("\\n", "\n")
-            content = content.replace("\\t", "\t")
-            content = content.replace("<bs>", "\\")
+            content = self._unescape(content)
             full_path = self._get_agent_path(file_path)
-            os.makedirs(os.path.dirname(full_path) or AGENT_BASE_DIR, exist_ok=True)
+            os.makedirs(os.path.dirname(full_path) or self.base_dir, exist_ok=True)
             with open(full_path, 'w', encoding='utf-8') as file:
                 file.write(content)
             return f"Successfully wrote to '{file_path}'."
@@ -69,201 +211,190 @@ class FileEditor:
         except Exception as e:
             return f"Error appending to file '{file_path}': {e}"
 
+    # Edit Tool
+    # Replace text that occurs exactly once (or every occurrence with "all")
+    def edit(self, file_path: str=".", search: str="", replace: str="", occurrences: str="") -> str:
+        try:
+            search, replace = self._unescape(search), self._unescape(replace)
+            if not search:
+                return "Error: The text to find must not be empty."
+            full_path = self._get_agent_path(file_path)
+            with open(full_path, 'r', encoding='utf-8', newline='') as file:
+                content = file.read()
+            if "\r\n" in content and "\r\n" not in search:
+                search, replace = search.replace("\n", "\r\n"), replace.replace("\n", "\r\n")
+            count = content.count(search)
+            if count == 0:
+                return f"Error: The text to find was not found in '{file_path}'. Read the lines you want to change and copy them exactly."
+            if count > 1 and occurrences != "all":
+                return f"Error: The text to find occurs {count} times in '{file_path}'. Include more surrounding lines to make it unique, or add 'all' to replace every occurrence."
+            line = content.count("\n", 0, content.find(search)) + 1
+            content = content.replace(search, replace)
+            with open(full_path, 'w', encoding='utf-8', newline='') as file:
+                file.write(content)
+            return f"Successfully edited '{file_path}' ({count} replacement{'s' if count > 1 else ''}, first at line {line})."
+
+        except FileNotFoundError:
+            return f"Error: File not found at '{file_path}'."
+        except Exception as e:
+            return f"Error editing file '{file_path}': {e}"
+
+    # Patch Tool
+    # Apply the hunks of a unified diff; a hunk whose lines moved is searched for
+    # nearby. Nothing is written unless every hunk applies.
+    def patch(self, file_path: str=".", diff: str="") -> str:
+        try:
+            hunks = parse_hunks(self._unescape(diff))
+            if not hunks:
+                return "Error: No hunks found. Every hunk has to start with a line like '@@ -12,3 +12,4 @@'."
+            full_path = self._get_agent_path(file_path)
+            with open(full_path, 'r', encoding='utf-8', newline='') as file:
+                content = file.read()
+            newline = "\r\n" if "\r\n" in content else "\n"
+            lines = content.split(newline)
+            offset, position = 0, 0
+            for number, (old_start, old_lines, new_lines) in enumerate(hunks, 1):
+                expected = max(old_start - 1, 0) + offset
+                if not old_lines: # Pure insertion: "@@ -12,0 ..." inserts after line 12
+                    expected = old_start + offset
+                found = find_block(lines, old_lines, expected, position)
+                if found == -1:
+                    return f"Error: Hunk {number} does not match '{file_path}' (expected at line {old_start}). No changes were made."
+                lines[found:found + len(old_lines)] = new_lines
+                offset += found - expected + len(new_lines) - len(old_lines)
+                position = found + len(new_lines)
+            with open(full_path, 'w', encoding='utf-8', newline='') as file:
+                file.write(newline.join(lines))
+            return f"Successfully applied {len(hunks)} hunk{'s' if len(hunks) > 1 else ''} to '{file_path}'."
+
+        except FileNotFoundError:
+            return f"Error: File not found at '{file_path}'."
+        except Exception as e:
+            return f"Error patching file '{file_path}': {e}"
+
     # List Tool
-    def list(self, path: str=".", mode: str="ls", contents: list=[False, False, False, 0]) -> str:
+    # One os.scandir pass over the tree: entry types come from the DirEntry, a
+    # file is only stat'ed when sizes are wanted and only read when contents are.
+    # `ls` lists one level (with contents it descends like `lsc`, as it always
+    # did), `lsc` descends up to max_depth levels.
+    def list(self, path: str=".", mode: str="ls", contents: list=[False, False, False, 0], max_depth: int | None=None, max_entries: int | None=None) -> str:
         include_size = contents[0]
         include_type = contents[1]
         include_content = contents[2]
-        max_content_len = contents[3] if contents[3] > 0 else float('inf')
-
-        top_level_data = {
-            "listed_path": path,
-            "size": 0,
-            "content": {}
-        }
-        
+        max_content_len = contents[3] if len(contents) > 3 and contents[3] > 0 else None
+        if mode not in ("ls", "lsc"):
+            return json.dumps({"error": "Invalid mode. Use 'ls' or 'lsc'."}, indent=4)
+        if max_depth is None:
+            max_depth = 1 if mode == "ls" and not include_content else FILE_LIST["max_depth"]
+        max_entries = max_entries or FILE_LIST["max_entries"]
+        budget = [max_entries]
+        skipped = [0]
+        truncated = [False]
+
         try:
             full_dir_path = self._get_agent_path(path)
-
             if not os.path.isdir(full_dir_path):
                 return json.dumps({"error": f"Directory not found or is not a directory at '{path}'."}, indent=4)
 
-            def _process_directory(current_abs_path, is_root=False):
-                current_dir_size = 0
-                current_dir_content = {}
-
-                entries = os.listdir(current_abs_path)
-
-                entries.sort()
-
-                for entry_name in entries:
-                    entry_abs_path = os.path.join(current_abs_path, entry_name)
-                    entry_details = {}
-
-                    if os.path.isfile(entry_abs_path):
-                        file_size = os.path.getsize(entry_abs_path)
-                        current_dir_size += file_size
-                        
+            def _read_content(entry_path):
+                try:
+                    with open(entry_path, 'r', encoding='utf-8') as file:
+                        if max_content_len is None:
+                            return file.read()
+                        file_content = file.read(max_content_len + 1)
+                        return file_content[:max_content_len] + "..." if len(file_content) > max_content_len else file_content
+                except Exception:
+                    return "Non readable content"
+
+            def _file_size(entry):
+                try:
+                    return entry.stat().st_size
+                except OSError:
+                    return 0
+
+            # Size of a directory below the listed depth; nothing is built for it
+            def _tree_size(dir_path, rel_dir, rules):
+                total = 0
+                rules = rules + load_gitignore(dir_path, rel_dir)
+                try:
+                    with os.scandir(dir_path) as it:
+                        for entry in it:
+                            rel_path = rel_dir + entry.name
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                            if is_ignored(rules, rel_path, entry.name, is_dir):
+                                continue
+                            if is_dir:
+                                total += _tree_size(entry.path, rel_path + "/", rules)
+                            else:
+                                total += _file_size(entry)
+                except OSError:
+                    pass
+                return total
+
+            def _walk(dir_path, rel_dir, depth, rules):
+                listing, total = {}, 0
+                rules = rules + load_gitignore(dir_path, rel_dir)
+                try:
+                    with os.scandir(dir_path) as it:
+                        entries = sorted(it, key=lambda entry: entry.name)
+                except OSError:
+                    return {"error": "Cannot list directory"}, 0
+                for entry in entries:
+                    rel_path = rel_dir + entry.name
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if is_ignored(rules, rel_path, entry.name, is_dir):
+                        skipped[0] += 1
+                        continue
+                    if budget[0] <= 0:
+                        truncated[0] = True
+                        break
+                    budget[0] -= 1
+                    details = {}
+                    if is_dir:
                         if include_type:
-                            entry_details["type"] = "file"
+                            details["type"] = "directory"
+                        if depth < max_depth:
+                            sub_listing, size = _walk(entry.path, rel_path + "/", depth + 1, rules)
+                        else:
+                            size = _tree_size(entry.path, rel_path + "/", rules) if include_size else 0
                         if include_size:
-                            entry_details["size"] = file_size
+                            details["size"] = size
+                        if depth < max_depth:
+                            details["content"] = sub_listing
+                    else:
+                        if include_type:
+                            details["type"] = "file"
+                        size = _file_size(entry) if include_size else 0
+                        if include_size:
+                            details["size"] = size
                         if include_content:
-                            try:
-                                with open(entry_abs_path, 'r', encoding='utf-8') as file:
-                                    file_content = file.read()
-                                    if len(file_content) > max_content_len:
-                                        entry_details["content"] = file_content[:int(max_content_len)] + "..."
-                                    else:
-                                        entry_details["content"] = file_content
-                            except Exception:
-                                entry_details["content"] = "Non readable content"
-                        current_dir_content[entry_name] = entry_details
-
-                    elif os.path.isdir(entry_abs_path):
-                        if mode == "lsc" or (mode == "ls" and is_root):
-                            subdir_result, subdir_size = _process_directory(entry_abs_path)
-                            current_dir_size += subdir_size
-                            
-                            subdir_details = {}
-                            if include_type:
-                                subdir_details["type"] = "directory"
-                            if include_size:
-                                subdir_details["size"] = subdir_size
-                            subdir_details["content"] = subdir_result
-                            current_dir_content[entry_name] = subdir_details
-                        elif mode == "ls" and not is_root:
-                            entry_details = {}
-                            if include_type:
-                                entry_details["type"] = "directory"
-                            current_dir_content[entry_name] = entry_details
-                            
-                return current_dir_content, current_dir_size
-
-            if mode == "ls":
-                def _build_dir_structure(current_abs_path, is_recursive_mode):
-                    current_struct_content = {}
-                    current_struct_size = 0
-
-                    try:
-                        entries = os.listdir(current_abs_path)
-                        entries.sort()
-                    except OSError:
-                        return {"error": "Cannot list directory"}, 0
-
-                    for entry_name in entries:
-                        entry_abs_path = os.path.join(current_abs_path, entry_name)
-                        entry_details = {}
-
-                        if os.path.isfile(entry_abs_path):
-                            file_size = os.path.getsize(entry_abs_path)
-                            current_struct_size += file_size
-                            
-                            if include_type:
-                                entry_details["type"] = "file"
-                            if include_size:
-                                entry_details["size"] = file_size
-                            if include_content:
-                                try:
-                                    with open(entry_abs_path, 'r', encoding='utf-8') as file:
-                                        file_content = file.read()
-                                        if len(file_content) > max_content_len:
-                                            entry_details["content"] = file_content[:int(max_content_len)] + "..."
-                                        else:
-                                            entry_details["content"] = file_content
-                                except Exception:
-                                    entry_details["content"] = "Non readable content"
-                            current_struct_content[entry_name] = entry_details
-
-                        elif os.path.isdir(entry_abs_path):
-                            subdir_content, subdir_size = {}, 0
-                            if is_recursive_mode:
-                                subdir_content, subdir_size = _build_dir_structure(entry_abs_path, True)
-                            elif mode == "ls" and include_content:
-                                temp_content, temp_size = _build_dir_structure(entry_abs_path, False)
-                                subdir_content = temp_content
-
-                                total_subdir_size = 0
-                                for _r, _d, _f in os.walk(entry_abs_path):
-                                    for _file in _f:
-                                        total_subdir_size += os.path.getsize(os.path.join(_r, _file))
-                                subdir_size = total_subdir_size
-
-                            current_struct_size += subdir_size
-
-                            dir_details = {}
-                            if include_type:
-                                dir_details["type"] = "directory"
-                            if include_size:
-                                dir_details["size"] = subdir_size
-                            if include_content:
-                                dir_details["content"] = subdir_content
-                            
-                            current_struct_content[entry_name] = dir_details
-                    
-                    return current_struct_content, current_struct_size
-
-                if mode == "lsc":
-                    processed_content, total_size = _build_dir_structure(full_dir_path, True)
-                elif mode == "ls":
-                    processed_content, total_size = _build_dir_structure(full_dir_path, False)
-                    total_size = 0
-                    for _r, _d, _f in os.walk(full_dir_path):
-                        for _file in _f:
-                            total_size += os.path.getsize(os.path.join(_r, _file))
-
-                else:
-                    return json.dumps({"error": "Invalid mode. Use 'ls' or 'lsc'."}, indent=4)
-
+                            details["content"] = _read_content(entry.path)
+                    total += size
+                    listing[entry.name] = details
+                return listing, total
+
+            # Paths are matched relative to the workspace, with the .gitignore files of all parent directories
+            rel_root = os.path.relpath(full_dir_path, self.base_dir).replace(os.sep, "/")
+            rel_root = "" if rel_root == "." else rel_root + "/"
+            rules = list(DEFAULT_IGNORE_RULES)
+            parts = rel_root.split("/")[:-1]
+            for i in range(len(parts)):
+                rules += load_gitignore(os.path.join(self.base_dir, *parts[:i]), "/".join(parts[:i]) + "/" if i else "")
+            listing, total_size = _walk(full_dir_path, rel_root, 1, rules)
+            top_level_data = {"listed_path": path}
+            if include_size:
                 top_level_data["size"] = total_size
-                top_level_data["content"] = processed_content
-                
-                if not include_size:
-                    del top_level_data["size"]
-                    def _remove_key_recursive(d, key_to_remove):
-                        if isinstance(d, dict):
-                            d.pop(key_to_remove, None)
-                            for k, v in d.items():
-                                if k == "content" and isinstance(v, dict):
-                                    _remove_key_recursive(v, key_to_remove)
-                                elif isinstance(v, dict):
-                                    _remove_key_recursive(v, key_to_remove)
-                    
-                    _remove_key_recursive(top_level_data["content"], "size")
-                    
-                if not include_type:
-                    def _remove_key_recursive_type(d, key_to_remove):
-                        if isinstance(d, dict):
-                            d.pop(key_to_remove, None)
-                            for k, v in d.items():
-                                if k == "content" and isinstance(v, dict):
-                                    _remove_key_recursive_type(v, key_to_remove)
-                                elif isinstance(v, dict):
-                                    _remove_key_recursive_type(v, key_to_remove)
-                    
-                    _remove_key_recursive_type(top_level_data["content"], "type")
-                
-                if not include_content:
-                    def _remove_key_recursive_content(d, key_to_remove):
-                        if isinstance(d, dict):
-                            d.pop(key_to_remove, None)
-                            for k, v in d.items():
-                                if k == "content" and isinstance(v, dict):
-                                    _remove_key_recursive_content(v, key_to_remove)
-                                elif isinstance(v, dict):
-                                    _remove_key_recursive_content(v, key_to_remove)
-                    
-                    _remove_key_recursive_content(top_level_data["content"], "content")
-
-
-                if not top_level_data["content"] and include_content:
-                    top_level_data["content"] = "Directory is empty."
-                elif not top_level_data["content"]:
-                     top_level_data["content"] = {}
-            
-                return json.dumps(top_level_data, indent=4)
+            if not listing and include_content:
+                top_level_data["content"] = "Directory is empty."
+            else:
+                top_level_data["content"] = listing
+            if truncated[0]:
+                top_level_data["truncated"] = f"Listing stopped after {max_entries} entries; list a subdirectory or lower the depth."
+            if skipped[0]:
+                top_level_data["ignored_entries"] = skipped[0]
+            return json.dumps(top_level_data, indent=4)
 
         except FileNotFoundError:
             return json.dumps({"error": f"Directory not found at '{path}'."}, indent=4)
         except Exception as e:
-            return json.dumps({"error": f"An unexpected error occurred while listing '{path}': {e}"}, indent=4)
\ No newline at end of file
+            return json.dumps({"error": f"An unexpected error occurred while listing '{path}': {e}"}, indent=4)
@@ -1,9 +1,18 @@
-from utils.model import CreateCommunicator
-import json, os
+from utils.router import create_communicator, RouterCommunicator
+from utils.cache import TwoTierCache
+from utils.config import CONFIG
+from utils.lazy import lazy_import
+import os, io, hashlib
+
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
 
 # -- Configuration --
-IMAGE_MODEL = json.load(open("config.json", "r"))["MODEL_CONFIG"]["IMAGE_MODEL"]
-AGENT_BASE_DIR = json.load(open("config.json", "r"))["AGENT_BASE_DIR"]
+IMAGE_MODEL = CONFIG["MODEL_CONFIG"]["IMAGE_MODEL"]
+AGENT_BASE_DIR = CONFIG["AGENT_BASE_DIR"]
+MODELS = CONFIG["MODELS"]
+IMAGE_CACHE = CONFIG["IMAGE_CACHE"]
+EXIF_ORIENTATION = 0x0112
 
 # -- Image Analyzer Prompt --
 IMAGE_ANALYZER_PROMPT = """
@@ -14,14 +23,63 @@ IMAGE_ANALYZER_PROMPT = """
 
 # -- Image Analyzer Class --
 class ImageAnalyzer:
-    def __init__(self):
-        self.communicator = CreateCommunicator(IMAGE_MODEL, mode="img")
+    def __init__(self, base_dir: str=AGENT_BASE_DIR):
+        self.base_dir = base_dir
+        self.communicator = create_communicator("IMAGE", IMAGE_MODEL, mode="img")
+        self.cache = TwoTierCache(IMAGE_CACHE["path"], IMAGE_CACHE["memory_entries"], IMAGE_CACHE["disk_entries"], IMAGE_CACHE["ttl"])
+
+    # Size and quality the model wants its images in
+    def _settings(self, model_idx: str) -> tuple:
+        return MODELS[model_idx].get("image_max_size"), MODELS[model_idx].get("image_quality", 85)
+
+    # -- Preprocess Image --
+    # Downscale images larger than max_size and re-encode them. Small JPEG/PNG
+    # files are sent as they are, unless their EXIF orientation says they are
+    # rotated: re-encoding drops EXIF, so the pixels are turned upright first.
+    def _preprocess(self, data: bytes, max_size: int | None, quality: int) -> dict:
+        image = Image.open(io.BytesIO(data))
+        image_format = image.format
+        mime_type = Image.MIME.get(image_format, "image/png")
+        rotated = image.getexif().get(EXIF_ORIENTATION, 1) != 1
+        if not rotated and (not max_size or (max(image.size) <= max_size and image_format in ("JPEG", "PNG"))):
+            return {"mime_type": mime_type, "data": data}
+        image = ImageOps.exif_transpose(image)
+        if max_size:
+            image.thumbnail((max_size, max_size))
+        output = io.BytesIO()
+        if image.mode in ("RGBA", "LA", "P") and image_format != "JPEG":
+            image.save(output, format="PNG", optimize=True)
+            return {"mime_type": "image/png", "data": output.getvalue()}
+        image.convert("RGB").save(output, format="JPEG", quality=quality)
+        return {"mime_type": "image/jpeg", "data": output.getvalue()}
+
+    # The image for the model that answers: a router may fall back to a model
+    # with other settings, so it gets a function and prepares it per model
+    def _image_context(self, data: bytes):
+        prepared = {}
+        def for_model(model_idx: str) -> dict:
+            settings = self._settings(model_idx)
+            if settings not in prepared:
+                prepared[settings] = self._preprocess(data, *settings)
+            return prepared[settings]
+        if isinstance(self.communicator, RouterCommunicator):
+            return for_model
+        return for_model(IMAGE_MODEL)
 
     # -- Analyze Image --
     def analyze(self, message: str="", image_path: str=None):
         try:
-            full_path = os.path.join(AGENT_BASE_DIR, image_path)
-            result = self.communicator.chat(message, full_path)[0]
+            full_path = os.path.join(self.base_dir, image_path)
+            if not os.path.isfile(full_path):
+                return "Error: Invalid image path provided!"
+            with open(full_path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            result = self.cache.get((digest, message, IMAGE_MODEL, *self._settings(IMAGE_MODEL)))
+            if result is None:
+                result = self.communicator.chat(message, self._image_context(data))[0]
+                model_idx = self.communicator.model_idx # The model that answered
+                self.cache.set((digest, message, model_idx, *self._settings(model_idx)), result)
             return f"Analysis result: {result}"
         except Exception as e:
-            return f"Error analyzing image: {e}"
\ No newline at end of file
+            return f"Error analyzing image: {e}"
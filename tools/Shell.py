@@ -1,18 +1,343 @@
-import json, subprocess
+import subprocess, os, sys, signal, selectors, threading, time, uuid, shutil, codecs, atexit, itertools, tempfile
+from utils.config import CONFIG
 
 # -- Configuration --
-FORBIDDEN_COMMANDS = json.load(open("config.json", "r"))["FORBIDDEN_COMMANDS"]
-AGENT_BASE_DIR = json.load(open("config.json", "r"))["AGENT_BASE_DIR"]
+FORBIDDEN_COMMANDS = CONFIG["FORBIDDEN_COMMANDS"]
+AGENT_BASE_DIR = CONFIG["AGENT_BASE_DIR"]
+SHELL_SESSION = CONFIG["SHELL_SESSION"]
+SHELL_OUTPUT = CONFIG["SHELL_OUTPUT"]
+SHELL_JOBS = CONFIG["SHELL_JOBS"]
 
 # -- Shell Executor Prompt --
 SHELL_EXECUTOR_PROMPT = """
 **Shell Executor**: Execute system shell commands. Use this tool to interact with the underlying system, install packages, or run scripts. Do not use it for tasks that involve generating or processing information that you can handle internally.
     * **Usage**: `<<<SHELL:'command_to_execute'>>>`
     * **Example**: `<<<SHELL:'python -c "print("Hello World!")"'>>>`, `<<<SHELL:'pip install requests'>>>`. Don't add extra quotes.
+    * **Info**: All commands run in the same shell, so the working directory, exported variables and activated virtualenvs are kept between calls.
+    * **Info**: Very long outputs are shortened to their beginning and end.
+    * **Info**: Don't end commands with `&`, start a background job instead.
+    * **Background Jobs**: For slow commands (builds, test suites, servers) start a job and keep working while it runs:
+        * `<<<SHELL:'start'<nex!-pr-amtre?gr+>'command'>>>` starts the command in the background, in the current directory and environment of the shell, and returns its job id.
+        * `<<<SHELL:'poll'<nex!-pr-amtre?gr+>'job_id'>>>` returns the status and the output since the last poll. Add `<nex!-pr-amtre?gr+>'seconds'` to wait up to that long for new output. Use `'all'` as job id to list all jobs.
+        * `<<<SHELL:'kill'<nex!-pr-amtre?gr+>'job_id'>>>` stops the job.
 """
 
+# -- Helpers --
+SAFE_CHARACTERS = set(b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 _-./,:=+@%")
+
+# Quote a command as a bash $'...' string
+def ansi_c_quote(command: str) -> str:
+    return "$'" + "".join(chr(byte) if byte in SAFE_CHARACTERS else f"\\x{byte:02x}" for byte in command.encode()) + "'"
+
+# -- Output Buffer Class --
+# Keeps the first and the last bytes of an output stream; memory stays at
+# max_bytes no matter how much is written.
+class OutputBuffer:
+    def __init__(self, max_bytes: int):
+        self.head_limit = max_bytes // 2
+        self.tail_limit = max_bytes - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def write(self, data: bytes):
+        self.total += len(data)
+        if len(self.head) < self.head_limit:
+            taken = self.head_limit - len(self.head)
+            self.head += data[:taken]
+            data = data[taken:]
+        if data:
+            self.tail += data
+            if len(self.tail) > self.tail_limit:
+                del self.tail[:len(self.tail) - self.tail_limit]
+
+    def getvalue(self) -> str:
+        omitted = self.total - len(self.head) - len(self.tail)
+        if omitted:
+            return f"{self.head.decode(errors='replace')}\n... [{omitted} bytes omitted] ...\n{self.tail.decode(errors='replace')}"
+        return (self.head + self.tail).decode(errors="replace")
+
+# -- Stream Capture Class --
+# Feeds one output stream of a command into an OutputBuffer and echoes it live.
+# With a marker, everything from the marker line on is held back and the rest
+# of that line is kept as the status of the command.
+class StreamCapture:
+    def __init__(self, max_bytes: int, echo_to=None, marker: bytes | None=None):
+        self.buffer = OutputBuffer(max_bytes)
+        self.echo_to = echo_to
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.marker = b"\n" + marker if marker else None
+        self.pending = b""
+        self.status = None
+        self.done = False
+
+    def _emit(self, data: bytes):
+        if not data:
+            return
+        self.buffer.write(data)
+        if self.echo_to is not None:
+            self.echo_to.write(self.decoder.decode(data))
+            self.echo_to.flush()
+
+    def feed(self, chunk: bytes):
+        if self.marker is None:
+            self._emit(chunk)
+            return
+        data = self.pending + chunk
+        index = data.find(self.marker)
+        if index == -1:
+            keep = min(len(data), len(self.marker) - 1) # The marker could start in the last bytes
+            self._emit(data[:len(data) - keep])
+            self.pending = data[len(data) - keep:]
+            return
+        self._emit(data[:index])
+        line_end = data.find(b"\n", index + len(self.marker))
+        if line_end == -1:
+            self.pending = data[index:]
+            return
+        self.status = data[index + len(self.marker):line_end].decode(errors="replace").strip()
+        self.pending = b""
+        self.done = True
+
+# Read the output streams until every capture is done or closed. Returns None,
+# or why the command has to be stopped ("timeout", or a note for output limits).
+def collect_output(captures: dict, timeout: float) -> str | None:
+    selector = selectors.DefaultSelector()
+    for stream in captures:
+        selector.register(stream, selectors.EVENT_READ)
+    start = time.monotonic()
+    open_streams = set(captures)
+    try:
+        while open_streams:
+            elapsed = time.monotonic() - start
+            if elapsed >= timeout:
+                return "timeout"
+            for key, _ in selector.select(min(timeout - elapsed, 1.0)):
+                chunk = os.read(key.fileobj.fileno(), 65536)
+                capture = captures[key.fileobj]
+                if chunk:
+                    capture.feed(chunk)
+                if not chunk or capture.done:
+                    selector.unregister(key.fileobj)
+                    open_streams.discard(key.fileobj)
+            total = sum(capture.buffer.total for capture in captures.values())
+            elapsed = time.monotonic() - start
+            if SHELL_OUTPUT["kill_after_bytes"] and total > SHELL_OUTPUT["kill_after_bytes"]:
+                return f"Note: The command was stopped after printing more than {SHELL_OUTPUT['kill_after_bytes']} bytes."
+            if SHELL_OUTPUT["kill_bytes_per_second"] and elapsed >= 1 and total / elapsed > SHELL_OUTPUT["kill_bytes_per_second"]:
+                return f"Note: The command was stopped for printing more than {SHELL_OUTPUT['kill_bytes_per_second']} bytes per second."
+        return None
+    finally:
+        selector.close()
+
+# Stop a process and its whole process group
+def kill_process_group(process: subprocess.Popen):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+# -- Shell Session Class --
+# A long-lived bash process inside the workspace. Every command is passed quoted
+# to `eval`, followed by a marker line carrying the exit code and the working
+# directory, so output of different commands can't get mixed up.
+class ShellSession:
+    def __init__(self, base_dir: str=AGENT_BASE_DIR):
+        self.base_dir = os.path.abspath(base_dir)
+        self.cwd = self.base_dir
+        self.process = None
+        self.lock = threading.Lock()
+
+    def _start(self):
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.process = subprocess.Popen(
+            ["bash", "--noprofile", "--norc"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, cwd=self.base_dir, start_new_session=True
+        )
+        self.cwd = self.base_dir
+
+    # Stop the shell and everything started from it
+    def close(self):
+        if self.process is not None:
+            kill_process_group(self.process)
+            for stream in (self.process.stdin, self.process.stdout, self.process.stderr):
+                stream.close()
+            self.process = None
+
+    # Run a command, returns (stdout, stderr, exit_code, note)
+    def run(self, command: str, timeout: int=300) -> tuple[str, str, int | None, str]:
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self.close()
+                self._start()
+            late_bytes = self._drain()
+            marker = f"__AGENT_DONE_{uuid.uuid4().hex}__"
+            script = ( # Background processes still running are counted and disowned, so they are reported once
+                f"eval {ansi_c_quote(command)} < /dev/null\n"
+                f"__agent_rc=$?; __agent_bg=$(jobs -pr | wc -l); disown -a; "
+                f"printf '\\n{marker} %s %s %s\\n' \"$__agent_rc\" \"$__agent_bg\" \"$PWD\"; printf '\\n{marker}\\n' >&2\n"
+            )
+            self.process.stdin.write(script.encode())
+            self.process.stdin.flush()
+
+            echo = SHELL_OUTPUT["echo"]
+            stdout = StreamCapture(SHELL_OUTPUT["max_bytes"], sys.stdout if echo else None, marker.encode())
+            stderr = StreamCapture(SHELL_OUTPUT["max_bytes"], sys.stderr if echo else None, marker.encode())
+            stop_reason = collect_output({self.process.stdout: stdout, self.process.stderr: stderr}, timeout)
+            if stop_reason == "timeout":
+                self.close()
+                raise subprocess.TimeoutExpired(command, timeout)
+            if stop_reason is not None:
+                self.close()
+                return stdout.buffer.getvalue(), stderr.buffer.getvalue(), None, stop_reason + " The shell session was restarted."
+            if not (stdout.done and stderr.done): # The shell exited (e.g. `exit` was called)
+                self.close()
+                return stdout.buffer.getvalue(), stderr.buffer.getvalue(), None, "Note: The shell session ended and was restarted."
+
+            exit_code, background, cwd = stdout.status.split(" ", 2)
+            notes = []
+            if late_bytes:
+                notes.append(f"Note: {late_bytes} bytes of output from earlier background processes were dropped.")
+            if int(background):
+                notes.append("Note: The command left background processes running. Output they print to the shell later is dropped. Use SHELL start for background work.")
+            self.cwd = os.path.abspath(cwd)
+            if os.path.commonpath([self.base_dir, self.cwd]) != self.base_dir:
+                self.process.stdin.write(f"cd {ansi_c_quote(self.base_dir)}\n".encode())
+                self.process.stdin.flush()
+                self.cwd = self.base_dir
+                notes.append("Note: The working directory left the workspace and was reset to it.")
+            return stdout.buffer.getvalue(), stderr.buffer.getvalue(), int(exit_code), "\n".join(notes)
+
+    # Read and drop what background processes printed since the last command,
+    # so it isn't taken for the output of the next one. Returns the dropped bytes.
+    def _drain(self) -> int:
+        dropped = 0
+        selector = selectors.DefaultSelector()
+        for stream in (self.process.stdout, self.process.stderr):
+            selector.register(stream, selectors.EVENT_READ)
+        try:
+            while events := selector.select(0):
+                for key, _ in events:
+                    chunk = os.read(key.fileobj.fileno(), 65536)
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                    dropped += len(chunk)
+        finally:
+            selector.close()
+        return dropped
+
+    # The exported variables of the running shell (cd, export, activated
+    # virtualenvs), or None if it has not started yet
+    def environment(self) -> dict | None:
+        if self.process is None or self.process.poll() is not None:
+            return None
+        fd, path = tempfile.mkstemp(prefix="agent-env-")
+        os.close(fd)
+        try:
+            _, stderr, exit_code, _ = self.run(f"command env -0 > {ansi_c_quote(path)}", 10)
+            if exit_code != 0:
+                raise Exception(f"Error reading the shell environment: {stderr.strip()}")
+            with open(path, "rb") as f:
+                raw = f.read()
+        finally:
+            os.remove(path)
+        return dict(os.fsdecode(item).split("=", 1) for item in raw.split(b"\0") if b"=" in item)
+
+# -- Shell Job Class --
+# A command running in the background in its own process group. A reader thread
+# collects stdout and stderr (merged) into a bounded buffer holding the output
+# since the last poll.
+class ShellJob:
+    def __init__(self, job_id: str, command: str, cwd: str, env: dict | None=None):
+        self.job_id = job_id
+        self.command = command
+        self.started = time.monotonic()
+        self.process = subprocess.Popen(
+            command, shell=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, cwd=cwd, env=env, start_new_session=True
+        )
+        self.buffer = OutputBuffer(SHELL_OUTPUT["max_bytes"])
+        self.lock = threading.Lock()
+        self.new_output = threading.Event()
+        self.killed = False
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        with self.process.stdout:
+            for chunk in iter(lambda: os.read(self.process.stdout.fileno(), 65536), b""):
+                with self.lock:
+                    self.buffer.write(chunk)
+                self.new_output.set()
+        self.process.wait()
+        self.new_output.set()
+
+    def running(self) -> bool:
+        return self.reader.is_alive()
+
+    def status(self) -> str:
+        if self.running():
+            return f"running for {time.monotonic() - self.started:.0f} seconds"
+        if self.killed:
+            return "killed"
+        return f"finished, EXIT CODE: {self.process.returncode}"
+
+    # Return the output since the last poll, waiting up to `wait` seconds for some
+    def poll(self, wait: float=0) -> str:
+        if wait > 0 and self.running():
+            self.new_output.wait(wait)
+        with self.lock:
+            output = self.buffer.getvalue()
+            self.buffer = OutputBuffer(SHELL_OUTPUT["max_bytes"])
+            self.new_output.clear()
+        output = f"OUTPUT:\n{output.strip()}" if output.strip() else "OUTPUT: [no new output]"
+        return f"JOB {self.job_id}: {self.status()}\n{output}"
+
+    def kill(self):
+        if self.running():
+            self.killed = True
+            kill_process_group(self.process)
+            self.reader.join(5)
+
 # -- Shell Executor Class --
 class ShellExecutor:
+    def __init__(self, persistent: bool=SHELL_SESSION, base_dir: str=AGENT_BASE_DIR):
+        self.base_dir = base_dir
+        self.session = ShellSession(base_dir) if persistent and shutil.which("bash") else None
+        self.jobs = {}
+        self.job_ids = itertools.count(1)
+        self.jobs_lock = threading.Lock()
+        atexit.register(self.kill_jobs)
+
+    # Run a command in a new shell, returns (stdout, stderr, exit_code, note)
+    def _run_once(self, command: str, timeout: int) -> tuple[str, str, int | None, str]:
+        process = subprocess.Popen(
+            command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=self.base_dir, start_new_session=True
+        )
+        echo = SHELL_OUTPUT["echo"]
+        stdout = StreamCapture(SHELL_OUTPUT["max_bytes"], sys.stdout if echo else None)
+        stderr = StreamCapture(SHELL_OUTPUT["max_bytes"], sys.stderr if echo else None)
+        started = time.monotonic()
+        try:
+            stop_reason = collect_output({process.stdout: stdout, process.stderr: stderr}, timeout)
+            if stop_reason == "timeout":
+                kill_process_group(process)
+                raise subprocess.TimeoutExpired(command, timeout)
+            if stop_reason is not None:
+                kill_process_group(process)
+                return stdout.buffer.getvalue(), stderr.buffer.getvalue(), None, stop_reason
+            try: # The command may close its output and keep running
+                exit_code = process.wait(max(timeout - (time.monotonic() - started), 0))
+            except subprocess.TimeoutExpired:
+                kill_process_group(process)
+                raise
+            return stdout.buffer.getvalue(), stderr.buffer.getvalue(), exit_code, ""
+        finally:
+            process.stdout.close()
+            process.stderr.close()
+
     # Execute Shell Command
     def execute(self, command: str="", timeout: int=300) -> str:
         try:
@@ -20,14 +345,73 @@ class ShellExecutor:
                 command = """pids=$(pgrep -f 'program_name.*<AGENT_BASE_DIR>'); if [ -n "$pids" ]; then kill $pids; echo "Killed processes with PIDs: $pids"; else echo "No matching processes found in sandbox."; fi"""
             if any(command.strip().startswith(forbidden) for forbidden in FORBIDDEN_COMMANDS):
                 return "Error: Forbidden shell command detected."
-            result = subprocess.run(
-                command, shell=True, capture_output=True, text=True,
-                check=False, cwd=AGENT_BASE_DIR, timeout=timeout
-            )
-            stdout = f"STDOUT:\n{result.stdout.strip()}" if result.stdout else "STDOUT: [empty]"
-            stderr = f"STDERR:\n{result.stderr.strip()}" if result.stderr else "STDERR: [empty]"
-            return f"{stdout}\n{stderr}"
+            if self.session is not None and command.rstrip().endswith("&") and not command.rstrip().endswith("&&"):
+                return "Error: Commands ending in '&' would keep writing into the shell. Use <<<SHELL:'start'<nex!-pr-amtre?gr+>'command'>>> for background work."
+            if self.session is not None:
+                result_stdout, result_stderr, exit_code, note = self.session.run(command, timeout)
+            else:
+                result_stdout, result_stderr, exit_code, note = self._run_once(command, timeout)
+            stdout = f"STDOUT:\n{result_stdout.strip()}" if result_stdout else "STDOUT: [empty]"
+            stderr = f"STDERR:\n{result_stderr.strip()}" if result_stderr else "STDERR: [empty]"
+            output = f"{stdout}\n{stderr}\nEXIT CODE: {exit_code}"
+            return f"{output}\n{note}" if note else output
         except subprocess.TimeoutExpired:
             return f"Error: Command timed out after {timeout} seconds."
         except Exception as e:
-            return f"Error executing shell command: {e}"
\ No newline at end of file
+            return f"Error executing shell command: {e}"
+
+    # Start, poll or kill a background job
+    def job(self, action: str, target: str="", wait: str="0") -> str:
+        try:
+            if action == "start":
+                return self.start_job(target)
+            if action == "poll" and target == "all":
+                with self.jobs_lock:
+                    jobs = list(self.jobs.values())
+                if not jobs:
+                    return "No background jobs."
+                return "\n".join(f"JOB {job.job_id}: {job.status()} - {job.command}" for job in jobs)
+            job = self.jobs.get(target)
+            if job is None:
+                return f"Error: Unknown job id '{target}'."
+            if action == "poll":
+                return job.poll(min(float(wait or 0), SHELL_JOBS["max_poll_wait"]))
+            if action == "kill":
+                job.kill()
+                return job.poll()
+            return f"Error: Unknown SHELL job action '{action}'."
+        except Exception as e:
+            return f"Error handling shell job: {e}"
+
+    # Start a command in the background and return its job id
+    def start_job(self, command: str) -> str:
+        if any(command.strip().startswith(forbidden) for forbidden in FORBIDDEN_COMMANDS):
+            return "Error: Forbidden shell command detected."
+        env = self.session.environment() if self.session is not None else None # Jobs run in the session's environment
+        with self.jobs_lock:
+            if sum(job.running() for job in self.jobs.values()) >= SHELL_JOBS["max_running"]:
+                return f"Error: {SHELL_JOBS['max_running']} jobs are already running. Poll or kill one first."
+            job_id = str(next(self.job_ids))
+            cwd = self.session.cwd if self.session is not None else self.base_dir
+            os.makedirs(cwd, exist_ok=True)
+            self.jobs[job_id] = ShellJob(job_id, command, cwd, env)
+        return f"Started JOB {job_id}. Poll it with <<<SHELL:'poll'<nex!-pr-amtre?gr+>'{job_id}'>>>."
+
+    # Kill all background jobs and forget them
+    def kill_jobs(self):
+        with self.jobs_lock:
+            jobs = list(self.jobs.values())
+            self.jobs.clear()
+        for job in jobs:
+            job.kill()
+
+    # Stop the shell session and all jobs; the next command starts a fresh one
+    def reset(self):
+        self.kill_jobs()
+        if self.session is not None:
+            self.session.close()
+
+    # Stop everything and drop the exit handler, for an executor that is thrown away
+    def close(self):
+        self.reset()
+        atexit.unregister(self.kill_jobs)
@@ -1,9 +1,16 @@
-import wikipedia, json
-from utils.model import CreateCommunicator
+import threading
+from utils.config import CONFIG
+from utils.lazy import lazy_import
+from utils.router import create_communicator
 from utils.parser import Parser
+from utils.cache import TwoTierCache
+from utils.console import notice
+
+wikipedia = lazy_import("wikipedia")
 
 # -- Configuration --
-WIKI_MODEL = json.load(open("config.json", "r"))["MODEL_CONFIG"]["WIKI_MODEL"]
+WIKI_MODEL = CONFIG["MODEL_CONFIG"]["WIKI_MODEL"]
+WIKI_CACHE = CONFIG["WIKI_CACHE"]
 
 # -- Wiki Search Prompt --
 WIKI_PROMPT = """
@@ -48,35 +55,104 @@ You will receive the tool output after each tool execution. Use this output to g
 Start by setting the language, then search for the topic, and finally return the result to the user.
 """
 
+# -- Language Gate Class --
+# The wikipedia module keeps its language globally. Requests in the same language
+# may run at the same time, a request in another language waits until they are done.
+class LanguageGate:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.language = None
+        self.active = 0
+
+    def enter(self, language: str):
+        with self.condition:
+            while self.active and self.language != language:
+                self.condition.wait()
+            if self.language != language:
+                wikipedia.set_lang(language)
+                self.language = language
+            self.active += 1
+
+    def leave(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+LANGUAGE_GATE = LanguageGate()
+
 # -- Wiki Search Class --
 class WikiSearch:
     def __init__(self):
-        self.wiki_llm = CreateCommunicator(WIKI_MODEL)
+        self.wiki_llm = create_communicator("WIKI", WIKI_MODEL)
         self.init_prompt = INTERNAL_WIKI_PROMPT
         self.parser = Parser()
+        self.cache = TwoTierCache(WIKI_CACHE["path"], WIKI_CACHE["memory_entries"], WIKI_CACHE["disk_entries"], WIKI_CACHE["ttl"])
+
+    # Search Wikipedia, cached by (language, query)
+    def _search(self, query: str, language: str) -> list[str]:
+        results = self.cache.get(("search", language, query))
+        if results is None:
+            LANGUAGE_GATE.enter(language)
+            try:
+                results = wikipedia.search(query)
+            finally:
+                LANGUAGE_GATE.leave()
+            self.cache.set(("search", language, query), results)
+        return results
+
+    # Get the summary or content of a page, cached by (language, title)
+    def _get_page(self, title: str, language: str, fields: tuple[str, ...]=("summary",)) -> dict:
+        page_data = dict(self.cache.get(("page", language, title)) or {})
+        missing = [field for field in fields if field not in page_data]
+        if missing:
+            LANGUAGE_GATE.enter(language)
+            try:
+                page = wikipedia.page(title, auto_suggest=False)
+                for field in missing:
+                    page_data[field] = getattr(page, field)
+            finally:
+                LANGUAGE_GATE.leave()
+            self.cache.set(("page", language, title), page_data)
+        return page_data
 
     # Wiki Search
+    # Return the original summary without the internal LLM, None if it needs to disambiguate
+    def _direct_summary(self, topic: str, language: str) -> str | None:
+        search_results = self._search(topic, language)
+        if not search_results:
+            return f"Error: No Wikipedia search results found for '{topic}'."
+        try:
+            page = self._get_page(search_results[0], language)
+        except (wikipedia.exceptions.DisambiguationError, wikipedia.exceptions.PageError):
+            return None
+        return f"Result from Wikipedia-Search: {page['summary']}"
+
     def search(self, topic: str="", language: str="en", length: str="summary", max_turns: int=10) -> str:
         try:
-            self.context = []
+            if length.strip().lower() == "summary":
+                result = self._direct_summary(topic, language)
+                if result is not None:
+                    return result
+            context = []
+            current_language = language
             current_internal_prompt = self.init_prompt.replace('{topic}', topic).replace('{language}', language).replace('{length}', length)
             for i in range(max_turns):
-                print(f"🧠 Internal Wiki-LLM Output: {current_internal_prompt[1:50].replace("\n", " ")}...")
-                wiki_llm_response, self.context = self.wiki_llm.chat(current_internal_prompt, self.context)
-                print(f"🧠 Internal Wiki-LLM Action: {wiki_llm_response[1:50].replace("\n", " ")}...")
+                notice(f"🧠 Internal Wiki-LLM Output: {current_internal_prompt[1:50].replace("\n", " ")}...")
+                wiki_llm_response, context = self.wiki_llm.chat(current_internal_prompt, context)
+                notice(f"🧠 Internal Wiki-LLM Action: {wiki_llm_response[1:50].replace("\n", " ")}...")
                 tool_calls = self.parser.extract_tagged_sections(wiki_llm_response)
                 output = []
                 for i, tool_call in enumerate(tool_calls):
                     params = self.parser.parse_tool_call(tool_call)
                     if params[0] == "SET_LANG":
                         try:
-                            wikipedia.set_lang(params[1])
+                            current_language = params[1]
                             output.append(f"Output from tool{i if i != 0 else ''}: Successfully set Wikipedia language to '{params[1]}'. ")
                         except Exception as e:
                             output.append(f"Output from tool{i if i != 0 else ''}: Error setting language: {e} ")
                     elif params[0] == "SEARCH":
                         try:
-                            search_results = wikipedia.search(params[1])
+                            search_results = self._search(params[1], current_language)
                             if search_results:
                                 output.append(f"Output from tool{i if i != 0 else ''}: Search Results (top 5): " + "".join(search_results[:5]) + " ")
                             else:
@@ -85,8 +161,8 @@ class WikiSearch:
                             output.append(f"Output from tool{i if i != 0 else ''}: Error during Wikipedia search: {e} ")
                     elif params[0] == "GET_PAGE_CONTENT":
                         try:
-                            page = wikipedia.page(params[1], auto_suggest=False)
-                            output.append(f"Output from tool{i if i != 0 else ''}: Page Content for '{params[1]}':\n{page.content[:2000]}... Page Summary:\n{page.summary} ")
+                            page = self._get_page(params[1], current_language, ("content", "summary"))
+                            output.append(f"Output from tool{i if i != 0 else ''}: Page Content for '{params[1]}':\n{page['content'][:2000]}... Page Summary:\n{page['summary']} ")
                         except wikipedia.exceptions.PageError:
                             output.append(f"Output from tool{i if i != 0 else ''}: Error: Page '{params[1]}' not found. ")
                         except wikipedia.exceptions.DisambiguationError as e:
@@ -95,8 +171,8 @@ class WikiSearch:
                             output.append(f"Output from tool{i if i != 0 else ''}: Error getting page content for '{params[1]}': {e} ")
                     elif params[0] == "GET_SUMMARY":
                         try:
-                            page = wikipedia.page(params[1], auto_suggest=False)
-                            output.append(f"Output from tool{i if i != 0 else ''}: Page Summary for '{params[1]}':\n{page.summary} ")
+                            page = self._get_page(params[1], current_language)
+                            output.append(f"Output from tool{i if i != 0 else ''}: Page Summary for '{params[1]}':\n{page['summary']} ")
                         except wikipedia.exceptions.PageError:
                             output.append(f"Output from tool{i if i != 0 else ''}: Error: Page '{params[1]}' not found. ")
                         except wikipedia.exceptions.DisambiguationError as e:
@@ -0,0 +1,122 @@
+import json, os, re, time, traceback, hashlib, shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from utils.config import CONFIG
+
+# -- Configuration --
+BATCH = CONFIG["BATCH"]
+
+# -- Task Helpers --
+# Tasks are JSONL lines {"id": ..., "task": ..., "max_turns": ...}; id and
+# max_turns are optional (the line number and BATCH.max_turns are used).
+def read_tasks(path: str) -> list[dict]:
+    tasks, seen = [], set()
+    with open(path, "r", encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            task = json.loads(line)
+            if isinstance(task, str):
+                task = {"task": task}
+            task["id"] = str(task.get("id", f"line-{number}"))
+            if task["id"] in seen:
+                print(f"⚠️ Skipping duplicate task id '{task['id']}' on line {number}.")
+                continue
+            seen.add(task["id"])
+            tasks.append(task)
+    return tasks
+
+# Ids that already have a result in the output file; failed tasks are run again
+def finished_ids(path: str) -> set:
+    status = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError: # Torn last line after a crash
+                    continue
+                status[record["id"]] = record["status"]
+    return {task_id for task_id, task_status in status.items() if task_status != "ERROR"}
+
+# Directory name for a task; ids that had to be changed get a hash so they can't collide
+def sandbox_name(task_id: str) -> str:
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", task_id)[:100]
+    if name == task_id and name not in (".", ".."):
+        return name
+    return f"{name}-{hashlib.sha1(task_id.encode()).hexdigest()[:8]}"
+
+# Worker processes run many tasks: stop the task's shell and close its database,
+# so neither they nor their exit handlers pile up in the worker
+def release_task(agent, database_path: str):
+    from tools.Database import ENGINES
+    agent.reset_context()
+    shell_executor = agent.tool_processor.shell_executor
+    if shell_executor is not None and shell_executor.loaded:
+        shell_executor.close()
+    engine = ENGINES.pop(os.path.abspath(database_path), None)
+    if engine is not None:
+        engine.close()
+
+# -- Run One Task --
+# Runs in a worker process: a fresh Agent with its own workspace and database
+# inside the task's sandbox, which is emptied first. Nobody can answer
+# questions, so ASK_USER is off.
+def run_task(task: dict, sandbox_dir: str) -> dict:
+    from main import Agent, ACTIVATED_TOOLS
+    sandbox = os.path.join(sandbox_dir, sandbox_name(task["id"]))
+    database_path = os.path.join(sandbox, "data.json")
+    record = {"id": task["id"], "started": datetime.now(timezone.utc).isoformat(), "sandbox": sandbox, "pid": os.getpid()}
+    start = time.perf_counter()
+    agent = None
+    try:
+        if os.path.exists(sandbox): # A resumed task starts over, not on the workspace of its last try
+            shutil.rmtree(sandbox)
+        agent = Agent(
+            base_dir=os.path.join(sandbox, "workspace"), verbose=False,
+            activated_tools={**ACTIVATED_TOOLS, "ask_user": False},
+            database_path=database_path,
+        )
+        status, result, turns = agent.run(task["task"], task.get("max_turns", BATCH["max_turns"]))
+        record.update(status=status, result=result, turns=turns)
+    except Exception as e:
+        record.update(status="ERROR", result=None, turns=len(agent.context_manager.turns) if agent else 0, error=f"{e}\n{traceback.format_exc()}")
+    finally:
+        if agent is not None:
+            release_task(agent, database_path)
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+# -- Run Batch --
+# Runs every task without a result in `output_path` on a pool of worker
+# processes and appends one JSON line per finished task. The rate limiter keeps
+# its buckets in lock files, so all workers share the model quotas.
+def run_batch(tasks_path: str, output_path: str, workers: int=BATCH["workers"], sandbox_dir: str=BATCH["sandbox_dir"]) -> dict:
+    tasks = read_tasks(tasks_path)
+    done = finished_ids(output_path)
+    pending = [task for task in tasks if task["id"] not in done]
+    print(f"📋 {len(tasks)} tasks, {len(tasks) - len(pending)} already done, running {len(pending)} on {workers} workers.")
+    counts = {"FINISHED": 0, "INCOMPLETE": 0, "ERROR": 0}
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "a", encoding="utf-8") as output, ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_task, task, sandbox_dir): task for task in pending}
+        try:
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except Exception as e: # The worker process died
+                    record = {"id": futures[future]["id"], "status": "ERROR", "result": None, "turns": 0, "error": str(e)}
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                os.fsync(output.fileno())
+                counts[record["status"]] += 1
+                print(f"{'✅' if record['status'] == 'FINISHED' else '🚫'} [{sum(counts.values())}/{len(pending)}] {record['id']}: {record['status']} after {record['turns']} turns")
+        except KeyboardInterrupt:
+            print("\n⏹️ Interrupted, finished results are saved. Run the same command again to resume.")
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+    elapsed = time.perf_counter() - start
+    summary = {**counts, "seconds": round(elapsed, 1), "tasks_per_minute": round(sum(counts.values()) / elapsed * 60, 2) if elapsed else 0}
+    print(f"📊 Batch done: {summary}")
+    return summary
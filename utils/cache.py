@@ -0,0 +1,68 @@
+import json, os, sqlite3, threading, time
+from collections import OrderedDict
+
+# -- Two Tier Cache Class --
+# In-memory LRU in front of an SQLite store on disk. Keys are tuples of
+# JSON-serializable parts, values anything json can dump. Entries older than
+# `ttl` seconds are treated as missing; both tiers evict the least recently
+# used entries once they hold more than their maximum number of entries.
+class TwoTierCache:
+    def __init__(self, path: str | None=None, memory_entries: int=256, disk_entries: int=10000, ttl: float | None=None):
+        self.memory = OrderedDict()
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self.db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+            self.db.commit()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and created < time.time() - self.ttl
+
+    def get(self, key: tuple):
+        key = json.dumps(key)
+        with self.lock:
+            if key in self.memory:
+                value, created = self.memory[key]
+                if not self._expired(created):
+                    self.memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self.memory[key]
+            if self.db is not None:
+                row = self.db.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    self.db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (time.time(), key))
+                    self.db.commit()
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self.stats["disk_hits"] += 1
+                    return value
+                if row is not None:
+                    self.db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    self.db.commit()
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key: tuple, value):
+        key = json.dumps(key)
+        now = time.time()
+        with self.lock:
+            self._remember(key, value, now)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)", (key, json.dumps(value), now, now))
+                self.db.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.disk_entries,))
+                self.db.commit()
+
+    # Put an entry into the memory tier and evict the least recently used ones
+    def _remember(self, key: str, value, created: float):
+        self.memory[key] = (value, created)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
@@ -0,0 +1,16 @@
+import json
+
+CONFIG_PATH = "config.json"
+
+# -- Load Config --
+# config.json is parsed once per process; every module reads its settings from CONFIG.
+def load_config(path: str=CONFIG_PATH) -> dict:
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        raise ValueError(f"{path} not found.")
+    except json.JSONDecodeError:
+        raise ValueError(f"Error decoding {path}.")
+
+CONFIG = load_config()
@@ -0,0 +1,20 @@
+import contextlib, contextvars
+
+# -- Verbosity --
+# Messages of shared code (rate limiter, router, model backends, tools) go through
+# `notice`, so they follow the verbosity of the session they run for. Agent.run
+# and Agent.arun set it; thread pools and background threads get it with the
+# copied context (see Telemetry.bind).
+VERBOSE = contextvars.ContextVar("verbose", default=True)
+
+def notice(text: str):
+    if VERBOSE.get():
+        print(text)
+
+@contextlib.contextmanager
+def verbosity(verbose: bool):
+    token = VERBOSE.set(verbose)
+    try:
+        yield
+    finally:
+        VERBOSE.reset(token)
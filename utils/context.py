@@ -0,0 +1,117 @@
+from utils.config import CONFIG
+
+# -- Configuration --
+MODELS = CONFIG["MODELS"]
+CONTEXT_CONFIG = CONFIG["CONTEXT"]
+
+# -- Summary Prompt --
+SUMMARY_PROMPT = """
+Summarize the following earlier part of a conversation between an AI-Assistant and its tools.
+Keep every fact, file name, path, command, result and error that could matter for the rest of the task. Be brief.
+Do NOT use any tools, just answer with the summary.
+
+"""
+
+COMPACTED_MARKER = "[Compacted]"
+
+# -- Context Entry Helpers --
+# Contexts are Ollama messages ({'role', 'content'}) or Gemini history entries
+# (Content objects or {'role', 'parts'} dicts).
+def get_role(entry) -> str:
+    if isinstance(entry, dict):
+        return entry["role"]
+    return entry.role
+
+def get_text(entry) -> str:
+    if isinstance(entry, dict):
+        if "content" in entry:
+            return entry["content"]
+        return "".join(part if isinstance(part, str) else getattr(part, "text", "") for part in entry["parts"])
+    return "".join(part.text for part in entry.parts)
+
+def with_text(entry, text: str):
+    if isinstance(entry, dict) and "content" in entry:
+        return {**entry, "content": text}
+    return {"role": get_role(entry), "parts": [text]}
+
+# Rough token estimate, good enough to keep a budget (about 4 characters per token)
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+# -- Context Manager Class --
+# Keeps a context under the token budget of its model. The first message (system
+# prompt and task) and the last turns stay verbatim; older messages are replaced
+# by short stubs or by one summary written by the model.
+class ContextManager:
+    def __init__(self, model_idx: str, llm=None, system_prompt: str | None=None):
+        self.budget = MODELS[model_idx].get("context_budget")
+        self.keep_recent_turns = CONTEXT_CONFIG["keep_recent_turns"]
+        self.mode = CONTEXT_CONFIG["mode"]
+        self.stub_min_chars = CONTEXT_CONFIG["stub_min_chars"]
+        self.llm = llm
+        self.system_prompt = system_prompt
+        self.saved_tokens = 0
+        self.turns = []
+
+    def count_tokens(self, context: list) -> int:
+        return sum(estimate_tokens(get_text(entry)) for entry in context)
+
+    # Compact the context if it exceeds the budget; returns the same list if nothing changed
+    def compact(self, context: list) -> list:
+        if not self.budget:
+            return context
+        tokens = self.count_tokens(context)
+        end = len(context) - 2 * self.keep_recent_turns
+        if tokens <= self.budget or end <= 1:
+            return context
+        if self.mode == "summary" and self.llm is not None:
+            compacted = self._summarize(context, end)
+        else:
+            compacted = self._stub(context, end)
+        self.saved_tokens += tokens - self.count_tokens(compacted)
+        return compacted
+
+    # Replace long messages between the first one and the recent turns with stubs
+    def _stub(self, context: list, end: int) -> list:
+        compacted = list(context)
+        changed = False
+        for i in range(1, end):
+            text = get_text(context[i])
+            if text.startswith(COMPACTED_MARKER):
+                continue
+            if self.system_prompt and text.startswith(self.system_prompt):
+                # A later task started here: keep the task, drop the repeated system prompt
+                stub = f"{COMPACTED_MARKER} System prompt omitted. Task: {text[len(self.system_prompt):]}"
+            elif len(text) >= self.stub_min_chars:
+                if get_role(context[i]) == "user":
+                    stub = f"{COMPACTED_MARKER} Tool output of {len(text)} characters omitted, it started with: {text[:200]}"
+                else:
+                    stub = f"{COMPACTED_MARKER} Response of {len(text)} characters omitted, it started with: {text[:200]}"
+            else:
+                continue
+            compacted[i] = with_text(context[i], stub)
+            changed = True
+        return compacted if changed else context
+
+    # Replace everything between the first message and the recent turns by one model-written summary
+    def _summarize(self, context: list, end: int) -> list:
+        if end % 2 == 1: # End on a model message, so the roles keep alternating
+            end -= 1
+        if end <= 2:
+            return self._stub(context, len(context) - 2 * self.keep_recent_turns)
+        transcript = "\n\n".join(f"{get_role(entry)}: {get_text(entry)}" for entry in context[1:end])
+        summary, _ = self.llm.chat(SUMMARY_PROMPT + transcript, [])
+        return [context[0], with_text(context[1], f"{COMPACTED_MARKER} Summary of the earlier turns: {summary}")] + context[end:]
+
+    # Record the token counts of a finished turn
+    def record(self, context: list, usage: dict | None=None) -> dict:
+        stats = {
+            "turn": len(self.turns) + 1,
+            "context_tokens": self.count_tokens(context),
+            "messages": len(context),
+            "saved_tokens": self.saved_tokens,
+        }
+        if usage:
+            stats.update(usage)
+        self.turns.append(stats)
+        return stats
@@ -0,0 +1,44 @@
+import importlib, threading
+
+# -- Lazy Module Class --
+# Stands in for a module and imports it on the first attribute access, so SDKs
+# of backends and tools that are never used are never imported.
+class LazyModule:
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attribute: str):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+# -- Lazy Tool Class --
+# Builds a tool on its first use and forwards every attribute to it.
+class LazyTool:
+    def __init__(self, factory, *args, **kwargs):
+        self._factory = factory
+        self._args = args
+        self._kwargs = kwargs
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory(*self._args, **self._kwargs)
+        return self._instance
+
+    def __getattr__(self, attribute: str):
+        return getattr(self.get(), attribute)
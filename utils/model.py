@@ -1,11 +1,20 @@
-import json, time, ollama, base64, os, google.generativeai as genai
-from collections import deque
-from PIL import Image
+import base64, contextvars, datetime, hashlib, os, re, threading, time
+from utils.config import CONFIG
+from utils.ratelimit import RATE_LIMITER
+from utils.lazy import lazy_import
+from utils.replay import CachingCommunicator, cache_mode
+from utils.console import notice
+
+# SDKs are imported on first use, only for the backends that are configured
+ollama = lazy_import("ollama")
+genai = lazy_import("google.generativeai")
+genai_caching = lazy_import("google.generativeai.caching")
+Image = lazy_import("PIL.Image")
 
 # -- Configuration --
-MODELS = json.load(open("config.json", "r"))["MODELS"]
-LLM_MODEL = json.load(open("config.json", "r"))["MODEL_CONFIG"]["LLM_MODEL"]
-WIKI_MODEL = json.load(open("config.json", "r"))["MODEL_CONFIG"]["WIKI_MODEL"]
+MODELS = CONFIG["MODELS"]
+LLM_MODEL = CONFIG["MODEL_CONFIG"]["LLM_MODEL"]
+WIKI_MODEL = CONFIG["MODEL_CONFIG"]["WIKI_MODEL"]
 
 # -- Init Prompt --
 INIT_PROMPT = """
@@ -39,45 +48,33 @@ Your available tools to achieve the goal are:
 **Here is your task to solve:**
 """
 
-class Waiter:
-    def __init__(self):
-        self.calls = {}
-
-    # Wait if needed based on rate limits from the MODELS-Config
-    def wait_if_needed(self, model_idx: str):
-        model_rate_limit = MODELS[model_idx]['rate_limit']
-        if model_rate_limit is not False and model_rate_limit is not None and model_idx in MODELS:
-            time_window = model_rate_limit[0]
-            rate_limit = model_rate_limit[1]
-            if model_idx not in self.calls:
-                self.calls[model_idx] = deque()
-            current_time = time.time()
-            while self.calls[model_idx] and self.calls[model_idx][0] <= current_time - time_window:
-                self.calls[model_idx].popleft()
-            if len(self.calls[model_idx]) >= rate_limit:
-                time_to_wait = (self.calls[model_idx][0] + time_window) - current_time
-                if time_to_wait > 0:
-                    print(f"🚫 Rate-limit for {model_idx} hit. Waiting for {time_to_wait:.2f} seconds...")
-                    time.sleep(time_to_wait)
-                    current_time_after_wait = time.time()
-                    while self.calls[model_idx] and self.calls[model_idx][0] <= current_time_after_wait - time_window:
-                        self.calls[model_idx].popleft()
-            self.calls[model_idx].append(time.time())
-
-    # Verify models on start of the programm
-    def verify(self):
-        if MODELS[LLM_MODEL]["text"] != [True, True]:
-            raise Exception(f"⚠️ Error during model verification: {LLM_MODEL} is not a text model")
-        if MODELS[WIKI_MODEL]["text"] != [True, True]:
-            raise Exception(f"⚠️ Error during model verification: {WIKI_MODEL} is not a text model")
+# Verify models on start of the programm
+def verify_models():
+    if MODELS[LLM_MODEL]["text"] != [True, True]:
+        raise Exception(f"⚠️ Error during model verification: {LLM_MODEL} is not a text model")
+    if MODELS[WIKI_MODEL]["text"] != [True, True]:
+        raise Exception(f"⚠️ Error during model verification: {WIKI_MODEL} is not a text model")
+
+verify_models()
 
 # 4. LLM COMMUNICATORS
 
-# -- Create Waiter Instance --
-WAITER = Waiter()
-WAITER.verify()
+# -- Gemini Context Caches --
+# One CachedContent per model and system prompt in this process, shared by all
+# communicators: {(model_idx, prompt hash): [GenerativeModel, expires_at]}.
+# CACHED_MODELS_LOCK only guards the dict; a cache is created (a network call)
+# under the lock of its key in CACHE_CREATE_LOCKS, so other keys don't wait for it.
+CACHED_MODELS = {}
+CACHED_MODELS_LOCK = threading.Lock()
+CACHE_CREATE_LOCKS = {}
+# Errors saying the cached content is gone; anything else (429, network) leaves it in place
+CACHE_GONE_PATTERN = re.compile(r"cached?.?content.{0,80}(not found|expired|does not exist)|(not found|expired).{0,80}cached?.?content", re.IGNORECASE)
 
 # -- Gemini Communicator Class --
+# With a system prompt (set_system_prompt) it is sent as system instruction.
+# If the model has a `cached_content_ttl`, the prompt is stored once as Gemini
+# cached content and every request only references it; when creating the cache
+# fails (e.g. the prompt is below the minimum size) the plain system instruction is used.
 class GeminiCommunicator:
     def __init__(self, model_idx: str, mode: str="txt"):
         model_config = MODELS[model_idx]
@@ -85,29 +82,156 @@ class GeminiCommunicator:
         self.model = genai.GenerativeModel(model_config['name'])
         self.model_idx = model_idx
         self.mode = mode
+        self.chat_session = None
+        self.session_model = None
+        self.session_history = None
+        self.session_length = 0
+        self.last_usage = None
+        self.system_prompt = None
+        self.cache_key = None
+
+    def set_system_prompt(self, prompt: str):
+        self.system_prompt = prompt
+        self.model = genai.GenerativeModel(MODELS[self.model_idx]['name'], system_instruction=prompt)
+        self.cache_key = (self.model_idx, hashlib.sha256(prompt.encode()).hexdigest())
+        self.chat_session = None
+
+    # Create the context cache in the background, so the first turn doesn't wait for it
+    def warm_up(self):
+        if self.system_prompt and MODELS[self.model_idx].get("cached_content_ttl"):
+            threading.Thread(target=contextvars.copy_context().run, args=(self._chat_model,), daemon=True).start()
+
+    # The model for chats: the cached content model while it is valid, else the plain one
+    def _chat_model(self):
+        ttl = MODELS[self.model_idx].get("cached_content_ttl")
+        if not self.system_prompt or not ttl:
+            return self.model
+        cached = self._cached_model()
+        if cached is not None:
+            return cached[0] or self.model
+        with CACHED_MODELS_LOCK:
+            create_lock = CACHE_CREATE_LOCKS.setdefault(self.cache_key, threading.Lock())
+        with create_lock:
+            cached = self._cached_model() # Another communicator may have just created it
+            if cached is None:
+                try:
+                    cached_content = genai_caching.CachedContent.create(
+                        model=f"models/{MODELS[self.model_idx]['name']}",
+                        system_instruction=self.system_prompt,
+                        ttl=datetime.timedelta(seconds=ttl),
+                    )
+                    cached = [genai.GenerativeModel.from_cached_content(cached_content=cached_content), time.time() + ttl]
+                except Exception as e:
+                    notice(f"⚠️ No context cache for {self.model_idx}, sending the system prompt with every request: {e}")
+                    cached = [None, float("inf")]
+                with CACHED_MODELS_LOCK:
+                    CACHED_MODELS[self.cache_key] = cached
+        return cached[0] or self.model
+
+    # The shared cache entry, or None if there is none or it is about to expire
+    def _cached_model(self):
+        with CACHED_MODELS_LOCK:
+            cached = CACHED_MODELS.get(self.cache_key)
+        if cached is not None and (cached[0] is None or cached[1] > time.time() + 60):
+            return cached
+        return None
+
+    # Reuse the live chat session if the context is still the history it returned last time
+    def _get_session(self, context: list):
+        model = self._chat_model()
+        if self.chat_session is None or model is not self.session_model or context is not self.session_history or len(context) != self.session_length:
+            self.chat_session = model.start_chat(history=context)
+            self.session_model = model
+        return self.chat_session
+
+    # After a failed request the chat session is started again. The shared cache is
+    # only dropped (and built anew next time) if the error says it expired or is gone.
+    def _drop_session(self, error: Exception):
+        self.chat_session = None
+        if self.session_model is not None and self.session_model is not self.model and CACHE_GONE_PATTERN.search(str(error)):
+            with CACHED_MODELS_LOCK:
+                if CACHED_MODELS.get(self.cache_key, [None])[0] is self.session_model:
+                    del CACHED_MODELS[self.cache_key]
 
     # Chat Method
-    def chat(self, message: str, context: list) -> tuple[str, list]:
+    def chat(self, message: str, context: list, on_chunk=None) -> tuple[str, list]:
         try:
             if self.mode == "txt":
-                WAITER.wait_if_needed(self.model_idx)
-                chat_session = self.model.start_chat(history=context)
-                response = chat_session.send_message(message)
-                model_response = response.text
-                updated_context = chat_session.history
-                return model_response, updated_context
+                chat_session = self._get_session(context)
+                if on_chunk is not None:
+                    streamed = []
+                    def send():
+                        response = chat_session.send_message(message, stream=True)
+                        for chunk in response:
+                            streamed.append(chunk)
+                            on_chunk(chunk.text)
+                        return response
+                    # A rate limit error can only be retried before anything was streamed
+                    response = RATE_LIMITER.call(self.model_idx, send, lambda: not streamed)
+                else:
+                    response = RATE_LIMITER.call(self.model_idx, lambda: chat_session.send_message(message))
+                return self._finish_turn(chat_session, response)
             elif self.mode == "img":
-                if not os.path.exists(context):
+                image = self._load_image(context)
+                if image is None:
                     return("Error: Invalid image path provided!", [])
-                image = Image.open(context)
                 contents = [message, image]
-                WAITER.wait_if_needed(self.model_idx)
-                response = self.model.generate_content(contents)
+                response = RATE_LIMITER.call(self.model_idx, lambda: self.model.generate_content(contents))
                 description = response.text
                 return description, []
         except Exception as e:
+            self._drop_session(e)
+            raise Exception(f"Error during Gemini chat communication: {e}")
+
+    # Async Chat Method, same results as chat without blocking the event loop
+    async def achat(self, message: str, context: list, on_chunk=None) -> tuple[str, list]:
+        try:
+            if self.mode == "txt":
+                chat_session = self._get_session(context)
+                if on_chunk is not None:
+                    streamed = []
+                    async def send():
+                        response = await chat_session.send_message_async(message, stream=True)
+                        async for chunk in response:
+                            streamed.append(chunk)
+                            on_chunk(chunk.text)
+                        return response
+                    response = await RATE_LIMITER.call_async(self.model_idx, send, lambda: not streamed)
+                else:
+                    response = await RATE_LIMITER.call_async(self.model_idx, lambda: chat_session.send_message_async(message))
+                return self._finish_turn(chat_session, response)
+            elif self.mode == "img":
+                image = self._load_image(context)
+                if image is None:
+                    return("Error: Invalid image path provided!", [])
+                contents = [message, image]
+                response = await RATE_LIMITER.call_async(self.model_idx, lambda: self.model.generate_content_async(contents))
+                return response.text, []
+        except Exception as e:
+            self._drop_session(e)
             raise Exception(f"Error during Gemini chat communication: {e}")
 
+    # Record the token usage and the history of a finished turn
+    def _finish_turn(self, chat_session, response) -> tuple[str, list]:
+        model_response = response.text
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self.last_usage = {"prompt_tokens": usage.prompt_token_count, "response_tokens": usage.candidates_token_count}
+            if getattr(usage, "cached_content_token_count", None):
+                self.last_usage["cached_tokens"] = usage.cached_content_token_count
+        updated_context = chat_session.history
+        self.session_history = updated_context
+        self.session_length = len(updated_context)
+        return model_response, updated_context
+
+    # Image from a path or an already loaded {'mime_type': ..., 'data': bytes} dict; None if the path is invalid
+    def _load_image(self, context):
+        if isinstance(context, dict):
+            return context
+        if not os.path.exists(context):
+            return None
+        return Image.open(context)
+
 # -- Ollama Communicator Class --
 class OllamaCommunicator:
     def __init__(self, model_idx: str, mode: str="txt"):
@@ -115,52 +239,142 @@ class OllamaCommunicator:
         host = model["host"]
         self.model_idx = model_idx
         self.model_name = model["name"]
+        self.host = host
         self.client = ollama.Client(host=host)
+        self.async_client = None
         self.mode = mode
+        self.last_usage = None
+        self.system_prompt = None
+        # keep_alive keeps the model (and the evaluated prompt prefix) loaded between tasks
+        self.request_options = {key: model[key] for key in ("keep_alive", "options") if model.get(key)}
+
+    # Sent as system message in front of every request. Ollama reuses the evaluated
+    # prefix of the previous request, so an unchanged prompt is not evaluated again.
+    def set_system_prompt(self, prompt: str):
+        self.system_prompt = prompt
+
+    def _with_system(self, messages: list) -> list:
+        if self.system_prompt:
+            return [{'role': 'system', 'content': self.system_prompt}] + messages
+        return messages
+
+    # Load the model and evaluate the system prompt in the background
+    def warm_up(self):
+        def load():
+            try:
+                options = {**self.request_options.get("options", {}), "num_predict": 1}
+                self.client.chat(model=self.model_name, messages=self._with_system([]), **{**self.request_options, "options": options})
+            except Exception as e:
+                notice(f"⚠️ Warm-up of {self.model_idx} failed: {e}")
+        threading.Thread(target=contextvars.copy_context().run, args=(load,), daemon=True).start()
 
     # Chat Method
-    def chat(self, message: str, context: list) -> tuple[str, list]:
+    def chat(self, message: str, context: list, on_chunk=None) -> tuple[str, list]:
         try:
             if self.mode == "txt":
                 messages_to_send = context + [{'role': 'user', 'content': message}]
-                WAITER.wait_if_needed(self.model_idx)
-                response = self.client.chat(model=self.model_name, messages=messages_to_send)
-                model_response_content = response['message']['content']
-                updated_context = messages_to_send + [{'role': 'assistant', 'content': model_response_content}]
-                return model_response_content, updated_context
+                if on_chunk is not None:
+                    parts = []
+                    def send():
+                        response = {}
+                        for part in self.client.chat(model=self.model_name, messages=self._with_system(messages_to_send), stream=True, **self.request_options):
+                            parts.append(part['message']['content'])
+                            on_chunk(parts[-1])
+                            response = part
+                        return response
+                    response = RATE_LIMITER.call(self.model_idx, send, lambda: not parts)
+                    model_response_content = "".join(parts)
+                else:
+                    response = RATE_LIMITER.call(self.model_idx, lambda: self.client.chat(model=self.model_name, messages=self._with_system(messages_to_send), **self.request_options))
+                    model_response_content = response['message']['content']
+                return self._finish_turn(messages_to_send, response, model_response_content)
             elif self.mode == "img":
-                if not os.path.exists(context):
+                messages = self._image_messages(message, context)
+                if messages is None:
                     return("Error: Invalid image path provided!", [])
-                with open(context, "rb") as f:
-                    image_base64 = base64.b64encode(f.read()).decode('utf-8')
-                    messages = [{
-                    'role': 'user',
-                    'content': message,
-                    'images': [image_base64]
-                    }]
-                    WAITER.wait_if_needed(self.model_idx)
-                    response = self.client.chat(
-                            model=self.model_name,
-                            messages=messages,
-                            stream=False
-                    )
-                    description = response['message']['content']
-                    return description, []
+                response = RATE_LIMITER.call(self.model_idx, lambda: self.client.chat(
+                        model=self.model_name,
+                        messages=messages,
+                        stream=False,
+                        **self.request_options
+                ))
+                description = response['message']['content']
+                return description, []
+            else:
+                raise ValueError(f"Unknown mode: {self.mode}")
+        except Exception as e:
+            raise Exception(f"Error during Ollama chat communication: {e}")
+
+    # Async Chat Method, same results as chat without blocking the event loop
+    async def achat(self, message: str, context: list, on_chunk=None) -> tuple[str, list]:
+        try:
+            if self.async_client is None:
+                self.async_client = ollama.AsyncClient(host=self.host)
+            if self.mode == "txt":
+                messages_to_send = context + [{'role': 'user', 'content': message}]
+                if on_chunk is not None:
+                    parts = []
+                    async def send():
+                        response = {}
+                        async for part in await self.async_client.chat(model=self.model_name, messages=self._with_system(messages_to_send), stream=True, **self.request_options):
+                            parts.append(part['message']['content'])
+                            on_chunk(parts[-1])
+                            response = part
+                        return response
+                    response = await RATE_LIMITER.call_async(self.model_idx, send, lambda: not parts)
+                    model_response_content = "".join(parts)
+                else:
+                    response = await RATE_LIMITER.call_async(self.model_idx, lambda: self.async_client.chat(model=self.model_name, messages=self._with_system(messages_to_send), **self.request_options))
+                    model_response_content = response['message']['content']
+                return self._finish_turn(messages_to_send, response, model_response_content)
+            elif self.mode == "img":
+                messages = self._image_messages(message, context)
+                if messages is None:
+                    return("Error: Invalid image path provided!", [])
+                response = await RATE_LIMITER.call_async(self.model_idx, lambda: self.async_client.chat(model=self.model_name, messages=messages, stream=False, **self.request_options))
+                return response['message']['content'], []
             else:
                 raise ValueError(f"Unknown mode: {self.mode}")
         except Exception as e:
             raise Exception(f"Error during Ollama chat communication: {e}")
 
+    # Record the token usage of a finished turn and build the new context
+    def _finish_turn(self, messages_to_send: list, response, model_response_content: str) -> tuple[str, list]:
+        if response.get('prompt_eval_count') is not None:
+            self.last_usage = {"prompt_tokens": response['prompt_eval_count'], "response_tokens": response.get('eval_count')}
+        updated_context = messages_to_send + [{'role': 'assistant', 'content': model_response_content}]
+        return model_response_content, updated_context
+
+    # Message with an image from a path or an already loaded {'mime_type': ..., 'data': bytes} dict; None if the path is invalid
+    def _image_messages(self, message: str, context) -> list | None:
+        if isinstance(context, dict):
+            image_base64 = base64.b64encode(context["data"]).decode('utf-8')
+        elif not os.path.exists(context):
+            return None
+        else:
+            with open(context, "rb") as f:
+                image_base64 = base64.b64encode(f.read()).decode('utf-8')
+        return [{
+        'role': 'user',
+        'content': message,
+        'images': [image_base64]
+        }]
+
 # -- Create Communicator Class --
+COMMUNICATOR_TYPES = {
+    "Gemini": GeminiCommunicator,
+    "Ollama": OllamaCommunicator,
+}
+
+# Builds the communicator for the type of the model. With LLM_CACHE.mode (or
+# AGENT_LLM_CACHE) set to record or replay it is wrapped in a CachingCommunicator.
 class CreateCommunicator:
-    def __init__(self, model_idx: str, mode: str="txt"):
+    def __new__(cls, model_idx: str, mode: str="txt"):
         model_config = MODELS[model_idx]
-        model_type = model_config["type"]
-        if model_type == "Gemini":
-            self.__class__ = GeminiCommunicator
-            self.__init__(model_idx, mode)
-        elif model_type == "Ollama":
-            self.__class__ = OllamaCommunicator
-            self.__init__(model_idx, mode)
-        else:
-            raise ValueError(f"Unbekannter Modelltyp: {model_config['type']}")
\ No newline at end of file
+        communicator_type = COMMUNICATOR_TYPES.get(model_config["type"])
+        if communicator_type is None:
+            raise ValueError(f"Unbekannter Modelltyp: {model_config['type']}")
+        cache = cache_mode()
+        if cache == "passthrough":
+            return communicator_type(model_idx, mode)
+        return CachingCommunicator(model_idx, mode, lambda: communicator_type(model_idx, mode), cache)
@@ -1,55 +1,107 @@
+from typing import NamedTuple
+
+# -- Parser Constants --
+DELIMITER_STR = "<nex!-pr-amtre?gr+>"
+PARSING_ERROR = "Error during parsing tool-format in your response"
+
+# -- Tool Call Class --
+class ToolCall(NamedTuple):
+    name: str
+    args: tuple[str, ...]
+    raw: str
+
 # -- Parser Class --
 class Parser:
+    # Split a response into parsed tool-calls. The next position of each marker is
+    # cached, so every character is scanned at most once per marker.
+    def tokenize(self, text: str) -> list[ToolCall] | str:
+        calls = []
+        next_open = text.find("<<<")
+        next_close = text.find(">>>")
+        while next_open != -1 or next_close != -1:
+            if next_close != -1 and (next_open == -1 or next_close < next_open):
+                return PARSING_ERROR
+            start = next_open + 3
+            if next_close == -1:
+                return PARSING_ERROR
+            next_open = text.find("<<<", start)
+            if next_open != -1 and next_open < next_close:
+                return PARSING_ERROR
+            calls.append(self.parse_block(text[start:next_close]))
+            next_close = text.find(">>>", next_close + 3)
+        return calls
+
     # Extract tool-calls
     def extract_tagged_sections(self, text: str) -> list[str] | str:
-        extracted = []
-        index = 0
-        stack = []
-        while index < len(text):
-            start = text.find("<<<", index)
-            end = text.find(">>>", index)
-            if start == -1 and end == -1:
-                break
-            if end != -1 and (start == -1 or end < start):
-                return "Error during parsing tool-format in your response"
-            if start != -1:
-                if stack:
-                    return "Error during parsing tool-format in your response"
-                stack.append(start)
-                end = text.find(">>>", start)
-                if end == -1:
-                    return "Error during parsing tool-format in your response"
-                content = text[start + 3:end]
-                if "<<<" in content or ">>>" in content:
-                    return "Error during parsing tool-format in your response"
-                extracted.append(content)
-                stack.pop()
-                index = end + 3
-            else:
-                index += 1
-        if stack:
-            return "Error during parsing tool-format in your response"
-        return extracted
+        calls = self.tokenize(text)
+        if isinstance(calls, str):
+            return calls
+        return [call.raw for call in calls]
 
-    # Parse tool-call
-    def parse_tool_call(self, block: str) -> list[str]:
-        DELIMITER_STR = "<nex!-pr-amtre?gr+>"
+    # Parse the content of one block into a tool-call
+    def parse_block(self, block: str) -> ToolCall:
         first_quote_index = block.find("'")
         if first_quote_index == -1:
             tool_name = block.strip()
-            if tool_name.endswith(":"):
+            if tool_name[-1:] == ":":
                 tool_name = tool_name[:-1]
-            return [tool_name]
+            return ToolCall(tool_name, (), block)
         tool_name = block[:first_quote_index].strip()
-        if tool_name.endswith(":"):
+        if tool_name[-1:] == ":":
             tool_name = tool_name[:-1]
-        params = [tool_name]
-        params_string = block[first_quote_index:]
-        parts_with_quotes = params_string.split(DELIMITER_STR)
-        for part_with_quote in parts_with_quotes:
-            if part_with_quote.startswith("'") and part_with_quote.endswith("'"):
-                param_content = part_with_quote[1:-1]
-                params.append(param_content)
-            else:
+        params = []
+        for part_with_quote in block[first_quote_index:].split(DELIMITER_STR):
+            if part_with_quote[-1:] != "'" or part_with_quote[:1] != "'":
                 break
-        return params
\ No newline at end of file
+            params.append(part_with_quote[1:-1])
+        return ToolCall(tool_name, tuple(params), block)
+
+    # Parse tool-call
+    def parse_tool_call(self, block: str) -> list[str]:
+        call = self.parse_block(block)
+        return [call.name, *call.args]
+
+# -- Stream Parser Class --
+# Incremental version of Parser.tokenize: feed() returns every tool-call as
+# soon as the closing marker of its block has arrived.
+class StreamParser:
+    def __init__(self):
+        self.parser = Parser()
+        self.buffer = ""
+        self.index = 0
+        self.start = -1
+        self.error = None
+
+    # Feed a chunk of the response, returns the newly completed tool-calls
+    def feed(self, chunk: str) -> list[ToolCall]:
+        self.buffer += chunk
+        calls = []
+        while self.error is None:
+            if self.start == -1:
+                start = self.buffer.find("<<<", self.index)
+                end = self.buffer.find(">>>", self.index)
+                if end != -1 and (start == -1 or end < start):
+                    self.error = PARSING_ERROR
+                    break
+                if start == -1:
+                    self.index = max(self.index, len(self.buffer) - 2)
+                    break
+                self.start = start + 3
+                self.index = start + 3
+            end = self.buffer.find(">>>", self.index)
+            if end == -1:
+                self.index = max(self.index, len(self.buffer) - 2)
+                break
+            if self.buffer.find("<<<", self.start, end) != -1:
+                self.error = PARSING_ERROR
+                break
+            calls.append(self.parser.parse_block(self.buffer[self.start:end]))
+            self.start = -1
+            self.index = end + 3
+        return calls
+
+    # Finish the stream, returns an error if the response was malformed
+    def close(self) -> str | None:
+        if self.error is None and self.start != -1:
+            self.error = PARSING_ERROR
+        return self.error
@@ -1,9 +1,49 @@
 # -- Importing Tools --
-from utils.parser import Parser
+from utils.parser import Parser, StreamParser, ToolCall
+from utils.telemetry import TELEMETRY
+from utils.profiling import PROFILER
+from concurrent.futures import ThreadPoolExecutor
+import json, ast
+
+# -- Tool Classification --
+# Every tool call touches one resource. Calls on the same resource only conflict
+# if at least one of them mutates it; non-conflicting calls can run concurrently.
+READ_ONLY_ACTIONS = {
+    "FILE": {"read", "list"},
+    "DATA": {"read", "list"},
+}
+TOOL_RESOURCES = {
+    "FILE": "workspace",
+    "SHELL": "workspace",
+    "IMAGE": "workspace",
+    "DATA": "database",
+    "WIKI": "wiki",
+    "ASK_USER": "user",
+}
+ALWAYS_READ_ONLY = {"WIKI", "IMAGE"}
+SHELL_JOB_ACTIONS = {"start", "poll", "kill"}
+# Known actions, used as metric labels (anything else could be a whole command)
+TOOL_ACTIONS = {
+    "FILE": {"read", "write", "append", "edit", "patch", "list"},
+    "DATA": {"read", "write", "list", "batch"},
+    "SHELL": SHELL_JOB_ACTIONS,
+}
+
+# A poll or kill only touches its background job; a poll empties the job's
+# output buffer, so two polls of the same job must not run at the same time
+def tool_resource(call: ToolCall) -> str | None:
+    if call.name == "SHELL" and len(call.args) > 1 and call.args[0] in ("poll", "kill"):
+        return f"shell-job:{call.args[1]}"
+    return TOOL_RESOURCES.get(call.name)
+
+def tool_action(call: ToolCall) -> str:
+    if call.args and call.args[0] in TOOL_ACTIONS.get(call.name, ()):
+        return call.args[0]
+    return "execute" if call.name == "SHELL" else ""
 
 # -- ToolProcessor Class --
 class ToolProcessor:
-    def __init__(self, file_manager, shell_executor, ask_user, wiki, image_analyzer, database):
+    def __init__(self, file_manager, shell_executor, ask_user, wiki, image_analyzer, database, parallel: bool=False, max_workers: int=4):
         self.file_manager = file_manager
         self.shell_executor = shell_executor
         self.ask_user = ask_user
@@ -11,69 +51,193 @@ class ToolProcessor:
         self.image_analyzer = image_analyzer
         self.database = database
         self.parser = Parser()
+        self.parallel = parallel
+        self.max_workers = max_workers
+
+    # Check if a tool call only reads from its resource
+    def is_read_only(self, call: ToolCall) -> bool:
+        if call.name in ALWAYS_READ_ONLY:
+            return True
+        if call.name in READ_ONLY_ACTIONS:
+            return len(call.args) > 0 and call.args[0] in READ_ONLY_ACTIONS[call.name]
+        return False
+
+    # Group tool calls into waves; calls inside one wave don't conflict with each other
+    def schedule(self, calls: list[ToolCall]) -> list[list[int]]:
+        waves = []
+        call_waves = []
+        for i, call in enumerate(calls):
+            resource = tool_resource(call)
+            read_only = self.is_read_only(call)
+            wave = 0
+            for j in range(i):
+                other = calls[j]
+                if resource is None or tool_resource(other) != resource:
+                    continue
+                if read_only and self.is_read_only(other):
+                    continue
+                wave = max(wave, call_waves[j] + 1)
+            call_waves.append(wave)
+            if wave == len(waves):
+                waves.append([])
+            waves[wave].append(i)
+        return waves
+
+    # Execute a single tool call and return its formatted output
+    def execute(self, i: int, call: ToolCall) -> str:
+        action = tool_action(call)
+        with TELEMETRY.span("tool", tool=call.name, action=action) as span, PROFILER.profile(call.name, action or call.name):
+            output = self._execute(i, call)
+            span.set(output_chars=len(output))
+            return output
+
+    def _execute(self, i: int, call: ToolCall) -> str:
+        args = call.args
+        if call.name == "FILE" and self.file_manager is not None:
+            try:
+                if args[0] == "read":
+                    result = self.file_manager.read(*args[1:3])
+                elif args[0] == "write":
+                    result = self.file_manager.write(args[1], args[2])
+                elif args[0] == "append":
+                    result = self.file_manager.append(args[1], args[2])
+                elif args[0] == "edit":
+                    result = self.file_manager.edit(*args[1:5])
+                elif args[0] == "patch":
+                    result = self.file_manager.patch(args[1], args[2])
+                elif args[0] == "list":
+                    options = [ast.literal_eval(arg) for arg in args[3:5]] # contents list, max depth
+                    result = self.file_manager.list(*args[1:3], *options)
+                else:
+                    result = f"Error: Unknown FILE action '{args[0]}'."
+                return f"Tool Output{i if i != 0 else ''}:" + result
+            except Exception as e:
+                return f"Error executing FILE tool{i if i != 0 else ''}: {e}"
+        elif call.name == "SHELL" and self.shell_executor is not None:
+            try:
+                if len(args) > 1 and args[0] in SHELL_JOB_ACTIONS:
+                    result = self.shell_executor.job(*args[:3])
+                else:
+                    result = self.shell_executor.execute(args[0])
+                return f"Tool Output{i if i != 0 else ''}:" + result
+            except Exception as e:
+                return f"Error executing SHELL tool{i if i != 0 else ''}: {e}"
+        elif call.name == "ASK_USER" and self.ask_user is not None:
+            try:
+                result = self.ask_user.ask(args[0])
+                return f"Tool Output{i if i != 0 else ''}:" + result
+            except Exception as e:
+                return f"Error executing ASK_USER tool{i if i != 0 else ''}: {e}"
+        elif call.name == "WIKI" and self.wiki is not None:
+            try:
+                result = self.wiki.search(*args[:3])
+                return f"Tool Output{i if i != 0 else ''}:" + result
+            except Exception as e:
+                return f"Error executing WIKI tool{i if i != 0 else ''}: {e}"
+        elif call.name == "IMAGE" and self.image_analyzer is not None:
+            try:
+                result = self.image_analyzer.analyze(args[1], args[0])
+                return f"Tool Output{i if i != 0 else ''}:" + result
+            except Exception as e:
+                return f"Error executing IMAGE tool{i if i != 0 else ''}: {e}"
+        elif call.name == "DATA" and self.database is not None:
+            try:
+                if args[0] == "read":
+                    result = self.database.read(args[1])
+                elif args[0] == "write":
+                    result = self.database.write(args[1], args[2])
+                elif args[0] == "list":
+                    result = self.database.list(args[1])
+                elif args[0] == "batch":
+                    result = self.database.batch(json.loads(args[1]))
+                else:
+                    result = f"Error: Unknown DATA action '{args[0]}'."
+                if not isinstance(result, str):
+                    result = json.dumps(result)
+                return f"Tool Output{i if i != 0 else ''}:" + result
+            except Exception as e:
+                return f"Error executing DATA tool{i if i != 0 else ''}: {e}"
+        elif call.name == "RESULT":
+            return args[0]
+        else:
+            return f"Error: Unknown tool{i if i != 0 else ''} call."
+
+    # Start processing a streamed response
+    def stream(self):
+        return ToolStream(self)
 
     def process(self, model_response: str) -> str:
-        tool_calls = self.parser.extract_tagged_sections(model_response)
-        outputs = []
-        for i, tool_call in enumerate(tool_calls):
-            params = self.parser.parse_tool_call(tool_call)
-            if params[0] == "FILE" and self.file_manager is not None:
-                try:
-                    if params[1] == "read":
-                        result = self.file_manager.read(params[2])
-                    elif params[1] == "write":
-                        result = self.file_manager.write(params[2], params[3])
-                    elif params[1] == "append":
-                        result = self.file_manager.append(params[2], params[3])
-                    elif params[1] == "list":
-                        result = self.file_manager.list(params[2])
-                    else:
-                        result = f"Error: Unknown FILE action '{params[1]}'."
-                    outputs.append(f"Tool Output{i if i != 0 else ''}:" + result)
-                except Exception as e:
-                    outputs.append(f"Error executing FILE tool{i if i != 0 else ''}: {e}")
-            elif params[0] == "SHELL" and self.shell_executor is not None:
-                try:
-                    result = self.shell_executor.execute(params[1])
-                    outputs.append(f"Tool Output{i if i != 0 else ''}:" + result)
-                except Exception as e:
-                    outputs.append(f"Error executing SHELL tool{i if i != 0 else ''}: {e}")
-            elif params[0] == "ASK_USER" and self.ask_user is not None:
-                try:
-                    result = self.ask_user.ask(params[1])
-                    outputs.append(f"Tool Output{i if i != 0 else ''}:" + result)
-                except Exception as e:
-                    outputs.append(f"Error executing ASK_USER tool{i if i != 0 else ''}: {e}")
-            elif params[0] == "WIKI" and self.wiki is not None:
-                try:
-                    result = self.wiki.search(params[1])
-                    outputs.append(f"Tool Output{i if i != 0 else ''}:" + result)
-                except Exception as e:
-                    outputs.append(f"Error executing WIKI tool{i if i != 0 else ''}: {e}")
-            elif params[0] == "IMAGE" and self.image_analyzer is not None:
-                try:
-                    result = self.image_analyzer.analyze(params[2], params[1])
-                    outputs.append(f"Tool Output{i if i != 0 else ''}:" + result)
-                except Exception as e:
-                    outputs.append(f"Error executing IMAGE tool{i if i != 0 else ''}: {e}")
-            elif params[0] == "DATA" and self.database is not None:
-                try:
-                    if params[1] == "read":
-                        result = self.database.read(params[2], params[3], params[4])
-                    elif params[1] == "write":
-                        result = self.database.write(params[2], params[3], params[4], params[5])
-                    elif params[1] == "list":
-                        result = self.database.list(params[2])
-                    else:
-                        result = f"Error: Unknown DATA action '{params[1]}'."
-                    outputs.append(f"Tool Output{i if i != 0 else ''}:" + result)
-                except Exception as e:
-                    outputs.append(f"Error executing DATA tool{i if i != 0 else ''}: {e}")
-            elif params[0] == "RESULT":
-                outputs.append(params[1])
-            else:
-                outputs.append(f"Error: Unknown tool{i if i != 0 else ''} call.")
-        if len(tool_calls) == 1:
-            if self.parser.parse_tool_call(tool_calls[0])[0] == "RESULT":
+        with TELEMETRY.span("parse", chars=len(model_response)):
+            calls = self.parser.tokenize(model_response)
+        if isinstance(calls, str):
+            return "CONTINUE", calls
+        outputs = [None] * len(calls)
+        if self.parallel and len(calls) > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                for wave in self.schedule(calls):
+                    futures = {i: pool.submit(TELEMETRY.bind(self.execute), i, calls[i]) for i in wave}
+                    for i, future in futures.items():
+                        outputs[i] = future.result()
+        else:
+            for i, call in enumerate(calls):
+                outputs[i] = self.execute(i, call)
+        if len(calls) == 1:
+            if calls[0].name == "RESULT":
                 return "FINISHED", "".join(outputs)
-        return "CONTINUE", "".join(str(output) for output in outputs if output)
\ No newline at end of file
+        return "CONTINUE", "".join(str(output) for output in outputs if output)
+
+
+# -- ToolStream Class --
+# Receives a response chunk by chunk and starts read-only tool calls as soon as
+# their block is complete. Mutating calls are held back until the whole
+# response has arrived and parsed, so a malformed response has no side effects.
+class ToolStream:
+    def __init__(self, processor: ToolProcessor):
+        self.processor = processor
+        self.parser = StreamParser()
+        self.pool = ThreadPoolExecutor(max_workers=processor.max_workers if processor.parallel else 1)
+        self.calls = []
+        self.futures = {}
+        self.held_resources = set()
+
+    # Feed a chunk of the model response
+    def feed(self, chunk: str):
+        for call in self.parser.feed(chunk):
+            i = len(self.calls)
+            self.calls.append(call)
+            resource = tool_resource(call)
+            if self.processor.is_read_only(call) and resource not in self.held_resources:
+                self.futures[i] = self.pool.submit(TELEMETRY.bind(self.processor.execute), i, call)
+            else:
+                self.held_resources.add(resource)
+
+    # Wait for the remaining tool calls and build the result like ToolProcessor.process
+    def finish(self) -> tuple[str, str]:
+        try:
+            error = self.parser.close()
+            outputs = [None] * len(self.calls)
+            for i, future in self.futures.items():
+                outputs[i] = future.result()
+            if error:
+                return "CONTINUE", error
+            remaining = [i for i in range(len(self.calls)) if i not in self.futures]
+            if self.processor.parallel:
+                waves = self.processor.schedule([self.calls[i] for i in remaining])
+                for wave in waves:
+                    futures = {remaining[j]: self.pool.submit(TELEMETRY.bind(self.processor.execute), remaining[j], self.calls[remaining[j]]) for j in wave}
+                    for i, future in futures.items():
+                        outputs[i] = future.result()
+            else:
+                for i in remaining:
+                    outputs[i] = self.processor.execute(i, self.calls[i])
+            if len(self.calls) == 1:
+                if self.calls[0].name == "RESULT":
+                    return "FINISHED", "".join(outputs)
+            return "CONTINUE", "".join(str(output) for output in outputs if output)
+        finally:
+            self.pool.shutdown(wait=False)
+
+    # The response broke off: drop the calls that haven't started and the pool.
+    # Running calls are read-only and finish on their own, their results are discarded.
+    def abort(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,121 @@
+import contextlib, cProfile, glob, io, itertools, json, os, pstats, re, sys, threading, time, tracemalloc
+from utils.config import CONFIG
+
+# -- Configuration --
+PROFILING = CONFIG["PROFILING"]
+
+NULL_PROFILE = contextlib.nullcontext()
+
+# -- Profiler Class --
+# Wraps turns of Agent.run ("turn" scope; Agent.arun has none, its turns share
+# the event loop with other sessions) or tool calls (scope = tool name, e.g. "SHELL" or
+# "DATA"; "all" profiles everything) in cProfile and, if `memory` is on,
+# tracemalloc. Every profile is dumped as a .prof file (pstats, snakeviz, ...)
+# and a .txt report with the top functions and allocation sites; one summary line
+# per profile goes to summary.jsonl. Only one profile runs at a time: a profile
+# that starts while another one is running (a tool inside a profiled turn, or a
+# parallel tool) is skipped, the running one already covers it.
+class Profiler:
+    def __init__(self, scopes: list, turns: list | None=None, output_dir: str="./cache/profiles", top: int=25, memory: bool=True):
+        self.scopes = set(scopes)
+        self.turns = set(turns) if turns else None
+        self.output_dir = output_dir
+        self.top = top
+        self.memory = memory
+        self.lock = threading.Lock()
+        self.sequence = itertools.count(1)
+
+    def enabled(self, scope: str) -> bool:
+        return scope in self.scopes or "all" in self.scopes
+
+    # Context manager around the profiled code; a shared no-op if the scope is off
+    def profile(self, scope: str, label: str, turn: int | None=None):
+        if not self.scopes or not self.enabled(scope):
+            return NULL_PROFILE
+        if turn is not None and self.turns is not None and turn not in self.turns:
+            return NULL_PROFILE
+        return self._profile(scope, label)
+
+    @contextlib.contextmanager
+    def _profile(self, scope: str, label: str):
+        if not self.lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            started_tracing = False
+            snapshot = None
+            if self.memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(10)
+                    started_tracing = True
+                tracemalloc.reset_peak()
+                snapshot = tracemalloc.take_snapshot()
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                elapsed = time.perf_counter() - start
+                allocations, peak = None, None
+                if snapshot is not None:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    allocations = tracemalloc.take_snapshot().compare_to(snapshot, "lineno")
+                    if started_tracing:
+                        tracemalloc.stop()
+                self._dump(scope, label, profiler, elapsed, allocations, peak)
+        finally:
+            self.lock.release()
+
+    def _dump(self, scope: str, label: str, profiler: cProfile.Profile, elapsed: float, allocations: list | None, peak: int | None):
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self.sequence):04d}-{scope}-{re.sub(r'[^A-Za-z0-9_.-]', '_', label)[:40]}"
+        base = os.path.join(self.output_dir, name)
+        profiler.dump_stats(base + ".prof")
+
+        stats = pstats.Stats(profiler, stream=io.StringIO()).sort_stats("cumulative")
+        stats.print_stats(self.top)
+        report = [f"{scope} {label}: {elapsed:.3f} s" + (f", peak {peak / 1024:.1f} KiB traced" if peak is not None else ""), "", stats.stream.getvalue().strip()]
+        if allocations is not None:
+            report += ["", f"Top {self.top} allocation sites (size difference):"]
+            report += [f"{stat.size_diff / 1024:>10.1f} KiB {stat.count_diff:>+8} blocks  {stat.traceback[0]}" for stat in allocations[:self.top]]
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(report) + "\n")
+
+        top_functions = [
+            {"function": pstats.func_std_string(function), "calls": row[1], "tottime": round(row[2], 6), "cumtime": round(row[3], 6)}
+            for function, row in sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:5]
+        ]
+        summary = {"profile": name, "scope": scope, "label": label, "seconds": round(elapsed, 6), "peak_kib": round(peak / 1024, 1) if peak is not None else None, "top": top_functions}
+        with open(os.path.join(self.output_dir, "summary.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(summary) + "\n")
+
+# -- Summary Table --
+# Merges all profiles of a scope (or every scope) into one table of the top functions
+def summarize(output_dir: str=PROFILING["output_dir"], scope: str | None=None, top: int=PROFILING["top"], sort: str="cumulative") -> str:
+    pattern = f"*-{scope}-*.prof" if scope else "*.prof"
+    files = sorted(glob.glob(os.path.join(output_dir, pattern)))
+    if not files:
+        return f"No profiles found in {output_dir}."
+    stream = io.StringIO()
+    stats = pstats.Stats(files[0], stream=stream)
+    for file in files[1:]:
+        stats.add(file)
+    stream.write(f"{len(files)} profiles{f' of {scope}' if scope else ''} from {output_dir}\n")
+    stats.sort_stats(sort).print_stats(top)
+    return stream.getvalue()
+
+# -- Shared Profiler Instance --
+# AGENT_PROFILE (e.g. "SHELL,DATA", "turn" or "all") overrides PROFILING.scopes
+PROFILER = Profiler(
+    [scope.strip() for scope in os.environ["AGENT_PROFILE"].split(",") if scope.strip()] if "AGENT_PROFILE" in os.environ else PROFILING["scopes"],
+    PROFILING["turns"],
+    PROFILING["output_dir"],
+    PROFILING["top"],
+    PROFILING["memory"],
+)
+
+# python -m utils.profiling [scope]
+if __name__ == "__main__":
+    print(summarize(scope=sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,214 @@
+import asyncio, contextvars, json, os, re, threading, time
+from utils.config import CONFIG
+from utils.telemetry import TELEMETRY
+from utils.console import notice
+
+try:
+    import fcntl
+except ImportError: # No lock files on this platform, the limit is kept per process
+    fcntl = None
+
+# -- Configuration --
+MODELS = CONFIG["MODELS"]
+RATE_LIMIT = CONFIG["RATE_LIMIT"]
+
+# Off while a RouterCommunicator has another model to try: rate limit errors are
+# raised at once instead of being retried after a backoff sleep
+RETRY_RATE_LIMITS = contextvars.ContextVar("retry_rate_limits", default=True)
+
+# -- Rate Limit Errors --
+RATE_LIMIT_PATTERN = re.compile(r"\b429\b|rate.?limit|resource.?exhausted|quota", re.IGNORECASE)
+RETRY_AFTER_PATTERNS = [
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE),
+    re.compile(r"retry[ -]after[^\d]{0,5}(\d+(?:\.\d+)?)", re.IGNORECASE),
+    re.compile(r"retry in (\d+(?:\.\d+)?)\s*s", re.IGNORECASE),
+]
+
+def is_rate_limit_error(error: Exception) -> bool:
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    return bool(RATE_LIMIT_PATTERN.search(str(error)))
+
+# Seconds the provider asked us to wait, or None
+def retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    for pattern in RETRY_AFTER_PATTERNS:
+        match = pattern.search(str(error))
+        if match:
+            return float(match.group(1))
+    return None
+
+# -- Rate Limiter Class --
+# One token bucket per model: it refills at limit / window tokens per second and
+# every request takes a token. It holds up to `rate_limit_burst` tokens (default
+# `limit`, so an idle model takes a full burst without pacing; 1 spaces requests
+# evenly). The start times of the last `limit` requests are kept as well, so no
+# rolling window ever sees more than the limit, whatever the burst.
+# The buckets live in small JSON files guarded by flock, so all agent processes
+# on this machine share one quota. After a rate limit error the bucket is
+# blocked for the retry-after time, or an exponential backoff without one.
+class RateLimiter:
+    def __init__(self, state_dir: str | None=RATE_LIMIT["state_dir"]):
+        self.state_dir = state_dir if fcntl is not None else None
+        self.lock = threading.Lock()
+        self.local_state = {}
+
+    def _bucket(self, model_idx: str) -> tuple[float, float, float, int] | None:
+        rate_limit = MODELS[model_idx].get("rate_limit")
+        if not rate_limit:
+            return None
+        window, limit = rate_limit
+        return float(MODELS[model_idx].get("rate_limit_burst", limit)), limit / window, window, limit
+
+    # Run `update(state)` on the bucket of a model while holding its locks.
+    # Models without a rate limit only keep their backoff state in this process.
+    def _with_state(self, model_idx: str, update):
+        with self.lock:
+            if self.state_dir is None or self._bucket(model_idx) is None:
+                state = self.local_state.setdefault(model_idx, {})
+                return update(state)
+            os.makedirs(self.state_dir, exist_ok=True)
+            fd = os.open(os.path.join(self.state_dir, f"{model_idx}.json"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = b""
+                while chunk := os.read(fd, 65536):
+                    raw += chunk
+                try:
+                    state = json.loads(raw) if raw else {}
+                except json.JSONDecodeError: # Don't hand out a full quota, refill from empty
+                    state = {"tokens": 0}
+                result = update(state)
+                data = json.dumps(state).encode()
+                if data != raw:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    os.ftruncate(fd, 0)
+                    os.write(fd, data)
+                return result
+            finally:
+                os.close(fd)
+
+    def _refill(self, state: dict, capacity: float, rate: float, window: float, now: float):
+        tokens = state.get("tokens", capacity)
+        updated = state.get("updated", now)
+        state["tokens"] = min(capacity, tokens + max(now - updated, 0) * rate)
+        state["updated"] = now
+        state["recent"] = [start for start in state.get("recent", []) if start > now - window]
+
+    # Seconds until the rolling window has room and, if `paced`, the bucket has a token
+    def _wait(self, state: dict, bucket: tuple, now: float, paced: bool=True) -> float:
+        capacity, rate, window, limit = bucket
+        recent = state["recent"]
+        window_wait = recent[-limit] + window - now if len(recent) >= limit else 0
+        token_wait = (1 - state["tokens"]) / rate if paced else 0
+        return max(state.get("blocked_until", 0) - now, token_wait, window_wait, 0)
+
+    # Take a token if one is available; returns 0 or the seconds to wait
+    def try_acquire(self, model_idx: str) -> float:
+        bucket = self._bucket(model_idx)
+        if bucket is None:
+            return self._with_state(model_idx, lambda state: max(state.get("blocked_until", 0) - time.time(), 0))
+        def update(state):
+            now = time.time()
+            self._refill(state, *bucket[:3], now)
+            wait = self._wait(state, bucket, now)
+            if wait > 0:
+                return wait
+            state["tokens"] -= 1
+            state["recent"].append(now)
+            return 0
+        return self._with_state(model_idx, update)
+
+    # Seconds until a request to the model would go through, without taking a token.
+    # With `paced=False` only a used-up quota or a rate limit error counts, not the
+    # spacing a small burst adds between requests.
+    def time_until_available(self, model_idx: str, paced: bool=True) -> float:
+        bucket = self._bucket(model_idx)
+        if bucket is None:
+            return self._with_state(model_idx, lambda state: max(state.get("blocked_until", 0) - time.time(), 0))
+        def update(state):
+            now = time.time()
+            self._refill(state, *bucket[:3], now)
+            return self._wait(state, bucket, now, paced)
+        return self._with_state(model_idx, update)
+
+    # Block until the model may be called
+    def acquire(self, model_idx: str):
+        start = None
+        while (wait := self.try_acquire(model_idx)) > 0:
+            if start is None:
+                start = time.perf_counter()
+                if wait >= 1:
+                    notice(f"🚫 Rate-limit for {model_idx} hit. Waiting for {wait:.2f} seconds...")
+            time.sleep(wait)
+        if start is not None:
+            TELEMETRY.record("wait", start, model=model_idx)
+
+    # Wait until the model may be called without blocking the event loop
+    async def acquire_async(self, model_idx: str):
+        start = None
+        while (wait := self.try_acquire(model_idx)) > 0:
+            start = start or time.perf_counter()
+            await asyncio.sleep(wait)
+        if start is not None:
+            TELEMETRY.record("wait", start, model=model_idx)
+
+    # The provider rejected a request: empty the bucket and block it for a while
+    def penalize(self, model_idx: str, retry_after: float | None=None) -> float:
+        def update(state):
+            now = time.time()
+            strikes = state.get("strikes", 0) + 1
+            backoff = retry_after if retry_after is not None else min(RATE_LIMIT["backoff_base"] * 2 ** (strikes - 1), RATE_LIMIT["backoff_max"])
+            state.update(tokens=0, updated=now, strikes=strikes, blocked_until=max(state.get("blocked_until", 0), now + backoff))
+            return backoff
+        backoff = self._with_state(model_idx, update)
+        TELEMETRY.count("agent_rate_limit_errors_total", model=model_idx)
+        notice(f"🚫 {model_idx} answered with a rate limit error. Backing off for {backoff:.2f} seconds...")
+        return backoff
+
+    # A request went through: forget earlier strikes
+    def reward(self, model_idx: str):
+        def update(state):
+            state.pop("strikes", None)
+        self._with_state(model_idx, update)
+
+    # Call `function` under the rate limit, retrying after rate limit errors.
+    # `retryable` is asked before every retry (e.g. nothing was streamed yet).
+    def call(self, model_idx: str, function, retryable=lambda: True):
+        for attempt in range(RATE_LIMIT["max_retries"] + 1):
+            self.acquire(model_idx)
+            try:
+                result = function()
+            except Exception as e:
+                if attempt == RATE_LIMIT["max_retries"] or not is_rate_limit_error(e) or not retryable():
+                    raise
+                self.penalize(model_idx, retry_after(e))
+                if not RETRY_RATE_LIMITS.get():
+                    raise
+                continue
+            self.reward(model_idx)
+            return result
+
+    async def call_async(self, model_idx: str, function, retryable=lambda: True):
+        for attempt in range(RATE_LIMIT["max_retries"] + 1):
+            await self.acquire_async(model_idx)
+            try:
+                result = await function()
+            except Exception as e:
+                if attempt == RATE_LIMIT["max_retries"] or not is_rate_limit_error(e) or not retryable():
+                    raise
+                self.penalize(model_idx, retry_after(e))
+                if not RETRY_RATE_LIMITS.get():
+                    raise
+                continue
+            self.reward(model_idx)
+            return result
+
+# -- Shared Rate Limiter Instance --
+RATE_LIMITER = RateLimiter()
@@ -0,0 +1,180 @@
+import atexit, glob, gzip, hashlib, json, os, threading, time, zlib
+from utils.config import CONFIG
+from utils.context import get_role, get_text
+
+# -- Configuration --
+MODELS = CONFIG["MODELS"]
+LLM_CACHE = CONFIG["LLM_CACHE"]
+CACHE_MODES = ("passthrough", "record", "replay")
+
+# The mode can be switched per run without editing config.json
+def cache_mode() -> str:
+    mode = os.environ.get("AGENT_LLM_CACHE", LLM_CACHE["mode"])
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown LLM cache mode '{mode}', use one of {', '.join(CACHE_MODES)}.")
+    return mode
+
+# -- Request Keys --
+# A request is identified by model, mode, the context (as role/text pairs, so a
+# live Gemini history and its replayed dict version hash the same) and the prompt.
+def context_hash(context) -> str:
+    digest = hashlib.sha256()
+    if isinstance(context, dict): # Image: {'mime_type': ..., 'data': bytes}
+        digest.update(context["data"])
+    elif isinstance(context, str): # Image path, hashed by content so moved files still match
+        if os.path.isfile(context):
+            with open(context, "rb") as f:
+                digest.update(f.read())
+        else:
+            digest.update(context.encode())
+    else:
+        for entry in context:
+            digest.update(json.dumps([get_role(entry), get_text(entry)]).encode())
+    return digest.hexdigest()
+
+def request_key(model_idx: str, mode: str, context, message: str, system_prompt: str | None=None) -> str:
+    parts = [model_idx, mode, context_hash(context), message]
+    if system_prompt:
+        parts.append(hashlib.sha256(system_prompt.encode()).hexdigest())
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+# -- Replay Store Class --
+# Recorded responses as gzip JSONL files in one directory. Every process appends
+# to its own file, so parallel recordings never interleave; all files are read
+# on load. A file cut short by a crash is read up to its last complete line.
+class ReplayStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.records = {}
+        self.lock = threading.Lock()
+        self.file = None
+        for file_path in sorted(glob.glob(os.path.join(path, "*.jsonl.gz"))):
+            self._load(file_path)
+        atexit.register(self.close)
+
+    def _load(self, file_path: str):
+        try:
+            with gzip.open(file_path, "rt", encoding="utf-8") as file:
+                for line in file:
+                    record = json.loads(line)
+                    self.records.setdefault(record["key"], []).append(record)
+        except (EOFError, zlib.error, json.JSONDecodeError): # Unfinished file of a crashed or running recorder
+            pass
+
+    # The n-th response recorded for a key; repeats the last one when there are no more
+    def get(self, key: str, n: int=0) -> dict | None:
+        records = self.records.get(key)
+        if not records:
+            return None
+        return records[min(n, len(records) - 1)]
+
+    def add(self, record: dict):
+        with self.lock:
+            if self.file is None:
+                os.makedirs(self.path, exist_ok=True)
+                self.file = gzip.open(os.path.join(self.path, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl.gz"), "at", encoding="utf-8")
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.file.flush()
+            self.records.setdefault(record["key"], []).append(record)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+STORES = {}
+STORES_LOCK = threading.Lock()
+
+# One store per directory and process
+def get_store(path: str) -> ReplayStore:
+    key = os.path.abspath(path)
+    with STORES_LOCK:
+        if key not in STORES:
+            STORES[key] = ReplayStore(path)
+        return STORES[key]
+
+# -- Caching Communicator Class --
+# Wraps a communicator. `record` calls the model and stores every response,
+# `replay` answers only from the store and never builds the real communicator
+# (no SDK import, no network). The replayed context uses the plain dict format
+# of the model type, which both the SDKs and ContextManager accept.
+class CachingCommunicator:
+    def __init__(self, model_idx: str, mode: str, factory, cache: str="record", path: str=LLM_CACHE["path"]):
+        self.model_idx = model_idx
+        self.mode = mode
+        self.factory = factory
+        self.cache = cache
+        self.store = get_store(path)
+        self.inner = None
+        self.system_prompt = None
+        self.replayed = {}
+        self.last_usage = None
+        self.stats = {"hits": 0, "records": 0}
+
+    def _communicator(self):
+        if self.inner is None:
+            self.inner = self.factory()
+            if self.system_prompt:
+                self.inner.set_system_prompt(self.system_prompt)
+        return self.inner
+
+    def set_system_prompt(self, prompt: str):
+        self.system_prompt = prompt
+        if self.inner is not None:
+            self.inner.set_system_prompt(prompt)
+
+    def warm_up(self):
+        if self.cache != "replay":
+            self._communicator().warm_up()
+
+    # True if replay mode can answer this request
+    def recorded(self, message: str, context) -> bool:
+        return self.store.get(request_key(self.model_idx, self.mode, context, message, self.system_prompt)) is not None
+
+    def _context_after(self, message: str, context, response: str) -> list:
+        if self.mode != "txt":
+            return []
+        if MODELS[self.model_idx]["type"] == "Gemini":
+            return list(context) + [{"role": "user", "parts": [message]}, {"role": "model", "parts": [response]}]
+        return list(context) + [{"role": "user", "content": message}, {"role": "assistant", "content": response}]
+
+    # Serve a request from the store; returns None if it was never recorded
+    def _replay(self, key: str, message: str, context, on_chunk):
+        n = self.replayed.get(key, 0)
+        record = self.store.get(key, n)
+        if record is None:
+            return None
+        self.replayed[key] = n + 1
+        self.stats["hits"] += 1
+        self.last_usage = record.get("usage")
+        if on_chunk is not None:
+            on_chunk(record["response"])
+        return record["response"], self._context_after(message, context, record["response"])
+
+    def _record(self, key: str, response: str):
+        self.last_usage = self.inner.last_usage if self.mode == "txt" else None
+        self.stats["records"] += 1
+        self.store.add({"key": key, "model": self.model_idx, "mode": self.mode, "response": response, "usage": self.last_usage})
+
+    def chat(self, message: str, context, on_chunk=None) -> tuple[str, list]:
+        key = request_key(self.model_idx, self.mode, context, message, self.system_prompt)
+        if self.cache == "replay":
+            result = self._replay(key, message, context, on_chunk)
+            if result is None:
+                raise Exception(f"Error during replay: no recorded response for this {self.model_idx} request. Record the run first.")
+            return result
+        response, updated_context = self._communicator().chat(message, context, on_chunk)
+        self._record(key, response)
+        return response, updated_context
+
+    async def achat(self, message: str, context, on_chunk=None) -> tuple[str, list]:
+        key = request_key(self.model_idx, self.mode, context, message, self.system_prompt)
+        if self.cache == "replay":
+            result = self._replay(key, message, context, on_chunk)
+            if result is None:
+                raise Exception(f"Error during replay: no recorded response for this {self.model_idx} request. Record the run first.")
+            return result
+        response, updated_context = await self._communicator().achat(message, context, on_chunk)
+        self._record(key, response)
+        return response, updated_context
@@ -0,0 +1,179 @@
+import time
+from utils.config import CONFIG
+from utils.context import get_role, get_text, estimate_tokens
+from utils.model import CreateCommunicator, MODELS
+from utils.replay import cache_mode
+from utils.ratelimit import RATE_LIMITER, RETRY_RATE_LIMITS
+from utils.telemetry import TELEMETRY
+from utils.console import notice
+
+# -- Configuration --
+MODEL_ROUTING = CONFIG["MODEL_ROUTING"]
+LLM_MODEL = CONFIG["MODEL_CONFIG"]["LLM_MODEL"]
+
+# -- Context Conversion --
+# A context can move to a model of the other type: Ollama uses {'role', 'content'}
+# dicts with "assistant", Gemini Content objects or {'role', 'parts'} dicts with "model".
+# The context itself is returned when nothing needs converting, so a communicator
+# can still recognise its own history (GeminiCommunicator reuses its chat session).
+def to_ollama_context(context: list) -> list:
+    if all(isinstance(entry, dict) and "content" in entry for entry in context):
+        return context
+    return [
+        entry if isinstance(entry, dict) and "content" in entry
+        else {"role": "assistant" if get_role(entry) == "model" else get_role(entry), "content": get_text(entry)}
+        for entry in context
+    ]
+
+def to_gemini_context(context: list) -> list:
+    if not any(isinstance(entry, dict) and "content" in entry for entry in context):
+        return context
+    return [
+        {"role": "model" if entry["role"] == "assistant" else "user", "parts": [entry["content"]]}
+        if isinstance(entry, dict) and "content" in entry else entry
+        for entry in context
+    ]
+
+CONTEXT_CONVERTERS = {
+    "Gemini": to_gemini_context,
+    "Ollama": to_ollama_context,
+}
+
+# Models that can serve a mode: text in and out, or image in and text out
+def supports(model_idx: str, mode: str) -> bool:
+    model = MODELS[model_idx]
+    if mode == "img":
+        return model.get("image", [False, False])[0] and model.get("text", [False, False])[1]
+    return model.get("text", [False, False]) == [True, True]
+
+# -- Router Communicator Class --
+# Sends every call to the first model of the role that can take it now: the
+# configured model first, then the role's fallbacks. A model is skipped while
+# its quota is used up for longer than `max_wait` seconds, while it
+# cools down after an error, or if the context is over its budget. If the
+# chosen model fails, the next one is tried (unless part of a response was
+# already streamed). Rate limit errors are not retried with a sleep while
+# another model is left. If no model is ready, the one that is ready soonest is used.
+class RouterCommunicator:
+    def __init__(self, role: str, model_idx: str, mode: str="txt"):
+        routing = MODEL_ROUTING.get(role, {})
+        self.role = role
+        self.mode = mode
+        self.models = [model_idx] + [
+            idx for idx in routing.get("fallbacks", [])
+            if idx != model_idx and idx in MODELS and supports(idx, mode)
+            and (role == "LLM" or idx != LLM_MODEL) # Sub-tools must not use up the main loop's quota
+        ]
+        self.max_wait = routing.get("max_wait", 0)
+        self.error_cooldown = MODEL_ROUTING.get("error_cooldown", 30)
+        self.communicators = {}
+        self.cooldown_until = {}
+        self.system_prompt = None
+        self.replay = cache_mode() == "replay"
+        self.model_idx = model_idx
+        self.last_usage = None
+
+    def _communicator(self, model_idx: str):
+        if model_idx not in self.communicators:
+            communicator = CreateCommunicator(model_idx, self.mode)
+            if self.system_prompt:
+                communicator.set_system_prompt(self.system_prompt)
+            self.communicators[model_idx] = communicator
+        return self.communicators[model_idx]
+
+    def set_system_prompt(self, prompt: str):
+        self.system_prompt = prompt
+        for communicator in self.communicators.values():
+            communicator.set_system_prompt(prompt)
+
+    def warm_up(self):
+        for model_idx in self.models:
+            if MODELS[model_idx].get("warm_up", False):
+                self._communicator(model_idx).warm_up()
+
+    # Models in the order they should be tried for this call
+    def _route(self, message: str, context) -> list:
+        if self.replay: # Rate limits don't matter, take the model that answered in the recording
+            return sorted(self.models, key=lambda model_idx: not self._communicator(model_idx).recorded(message, self._context_for(model_idx, context)))
+        now = time.monotonic()
+        tokens = None
+        ready, later = [], []
+        for model_idx in self.models:
+            wait = max(RATE_LIMITER.time_until_available(model_idx, paced=False), self.cooldown_until.get(model_idx, 0) - now)
+            budget = MODELS[model_idx].get("context_budget")
+            if budget and self.mode == "txt" and model_idx != self.models[0]:
+                if tokens is None:
+                    tokens = sum(estimate_tokens(get_text(entry)) for entry in context)
+                if tokens > budget:
+                    wait = float("inf")
+            (ready if wait <= self.max_wait else later).append((wait, model_idx))
+        return [model_idx for _, model_idx in ready] + [model_idx for _, model_idx in sorted(later)]
+
+    # Text contexts are converted to the model's format. An image context may be
+    # a function of the model, so each model gets the image prepared for it.
+    def _context_for(self, model_idx: str, context):
+        if self.mode != "txt":
+            return context(model_idx) if callable(context) else context
+        return CONTEXT_CONVERTERS[MODELS[model_idx]["type"]](context)
+
+    def _failed(self, model_idx: str, error: Exception, fallback: str):
+        self.cooldown_until[model_idx] = time.monotonic() + self.error_cooldown
+        TELEMETRY.count("agent_router_fallbacks_total", role=self.role, model=model_idx)
+        notice(f"⚠️ {model_idx} failed ({str(error)[:200]}), falling back to {fallback}.")
+
+    def _used(self, model_idx: str, communicator):
+        self.model_idx = model_idx
+        self.last_usage = getattr(communicator, "last_usage", None)
+        TELEMETRY.count("agent_router_calls_total", role=self.role, model=model_idx)
+
+    def chat(self, message: str, context, on_chunk=None) -> tuple[str, list]:
+        route = self._route(message, context)
+        streamed = []
+        def feed(chunk: str):
+            streamed.append(chunk)
+            on_chunk(chunk)
+        for i, model_idx in enumerate(route):
+            communicator = self._communicator(model_idx)
+            last = i == len(route) - 1
+            token = RETRY_RATE_LIMITS.set(last)
+            try:
+                result = communicator.chat(message, self._context_for(model_idx, context), feed if on_chunk is not None else None)
+            except Exception as e:
+                if last or streamed:
+                    raise
+                self._failed(model_idx, e, route[i + 1])
+                continue
+            finally:
+                RETRY_RATE_LIMITS.reset(token)
+            self._used(model_idx, communicator)
+            return result
+
+    async def achat(self, message: str, context, on_chunk=None) -> tuple[str, list]:
+        route = self._route(message, context)
+        streamed = []
+        def feed(chunk: str):
+            streamed.append(chunk)
+            on_chunk(chunk)
+        for i, model_idx in enumerate(route):
+            communicator = self._communicator(model_idx)
+            last = i == len(route) - 1
+            token = RETRY_RATE_LIMITS.set(last)
+            try:
+                result = await communicator.achat(message, self._context_for(model_idx, context), feed if on_chunk is not None else None)
+            except Exception as e:
+                if last or streamed:
+                    raise
+                self._failed(model_idx, e, route[i + 1])
+                continue
+            finally:
+                RETRY_RATE_LIMITS.reset(token)
+            self._used(model_idx, communicator)
+            return result
+
+# -- Communicator For A Role --
+# "LLM", "WIKI" or "IMAGE": a router if the role has fallbacks, else the plain communicator
+def create_communicator(role: str, model_idx: str, mode: str="txt"):
+    router = RouterCommunicator(role, model_idx, mode)
+    if len(router.models) == 1:
+        return CreateCommunicator(model_idx, mode)
+    return router
@@ -0,0 +1,185 @@
+import atexit, contextvars, functools, itertools, json, os, threading, time
+from utils.config import CONFIG
+
+# -- Configuration --
+TELEMETRY_CONFIG = CONFIG["TELEMETRY"]
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Span attributes that become metric labels; everything else only goes to the trace
+METRIC_LABELS = ("model", "tool", "action")
+
+CURRENT_SPAN = contextvars.ContextVar("current_span", default=None)
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_labels(labels: tuple) -> str:
+    return ",".join(f"{key}=\"{escape_label(value)}\"" for key, value in labels)
+
+# -- Span Classes --
+# A timed block. Spans nest through a context variable, so the parent of a span is
+# the span around it in the same thread or asyncio task (see Telemetry.bind for pools).
+class Span:
+    __slots__ = ("telemetry", "name", "attrs", "span_id", "parent_id", "wall_start", "start", "token")
+
+    def __init__(self, telemetry, name: str, attrs: dict):
+        self.telemetry = telemetry
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = CURRENT_SPAN.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.span_id = self.telemetry.next_id()
+        self.token = CURRENT_SPAN.set(self)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self.start
+        CURRENT_SPAN.reset(self.token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.telemetry.emit(self.name, self.span_id, self.parent_id, self.wall_start, duration, self.attrs)
+        return False
+
+# Returned while telemetry is off: no clock reads, no allocations per call
+class NullSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+NULL_SPAN = NullSpan()
+
+# -- Telemetry Class --
+# Writes every finished span as one JSON line to the trace file and keeps
+# Prometheus histograms (per span name and METRIC_LABELS) and counters in memory.
+# The metrics file is rewritten atomically after every task and at most every
+# `metrics_interval` seconds otherwise. "{pid}" in a path is replaced by the id
+# of the writing process, so batch workers never share a metrics file.
+class Telemetry:
+    def __init__(self, enabled: bool, trace_path: str, metrics_path: str, metrics_interval: float=10):
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self.metrics_path = metrics_path
+        self.metrics_interval = metrics_interval
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.trace_fd = None
+        self.histograms = {}
+        self.counters = {}
+        self.metrics_written = time.monotonic()
+        if enabled:
+            atexit.register(self.close)
+
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attrs)
+
+    # A span that already ended; `start` is a time.perf_counter() value
+    def record(self, name: str, start: float, **attrs):
+        if not self.enabled:
+            return
+        parent = CURRENT_SPAN.get()
+        duration = time.perf_counter() - start
+        self.emit(name, self.next_id(), parent.span_id if parent is not None else None, time.time() - duration, duration, attrs)
+
+    def count(self, name: str, value: float=1, **labels):
+        if not self.enabled or not value:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    # Run `function` in the current context (span, verbosity) when it is handed to a
+    # thread pool. Copied even while telemetry is off, the verbosity depends on it.
+    def bind(self, function):
+        return functools.partial(contextvars.copy_context().run, function)
+
+    def next_id(self) -> str:
+        return f"{os.getpid()}-{next(self.ids)}"
+
+    def emit(self, name: str, span_id: str, parent_id: str | None, wall_start: float, duration: float, attrs: dict):
+        record = {"name": name, "id": span_id, "parent": parent_id, "start": round(wall_start, 6), "ms": round(duration * 1000, 3), "pid": os.getpid(), **attrs}
+        line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        labels = (("span", name),) + tuple((key, attrs[key]) for key in METRIC_LABELS if attrs.get(key) not in (None, ""))
+        with self.lock:
+            if self.trace_fd is None:
+                trace_path = self.trace_path.replace("{pid}", str(os.getpid()))
+                os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+                self.trace_fd = os.open(trace_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            os.write(self.trace_fd, line) # One write per line: lines of parallel processes don't interleave
+            histogram = self.histograms.get(labels)
+            if histogram is None:
+                histogram = self.histograms[labels] = [[0] * len(HISTOGRAM_BUCKETS), 0.0, 0]
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if duration <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += duration
+            histogram[2] += 1
+            due = name == "task" or time.monotonic() - self.metrics_written >= self.metrics_interval
+        if due:
+            self.write_metrics()
+
+    # Prometheus text format
+    def render_metrics(self) -> str:
+        with self.lock:
+            histograms = {labels: ([*buckets], total, count) for labels, (buckets, total, count) in self.histograms.items()}
+            counters = dict(self.counters)
+        lines = [
+            "# HELP agent_span_duration_seconds Duration of agent turns, LLM calls, rate limit waits and tool calls.",
+            "# TYPE agent_span_duration_seconds histogram",
+        ]
+        for labels, (buckets, total, count) in sorted(histograms.items()):
+            label_text = format_labels(labels)
+            for bound, bucket_count in zip(HISTOGRAM_BUCKETS, buckets):
+                lines.append(f"agent_span_duration_seconds_bucket{{{label_text},le=\"{bound}\"}} {bucket_count}")
+            lines.append(f"agent_span_duration_seconds_bucket{{{label_text},le=\"+Inf\"}} {count}")
+            lines.append(f"agent_span_duration_seconds_sum{{{label_text}}} {total}")
+            lines.append(f"agent_span_duration_seconds_count{{{label_text}}} {count}")
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{{{format_labels(labels)}}} {value}" if labels else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self):
+        if not self.enabled:
+            return
+        self.metrics_written = time.monotonic()
+        text = self.render_metrics()
+        metrics_path = self.metrics_path.replace("{pid}", str(os.getpid()))
+        os.makedirs(os.path.dirname(os.path.abspath(metrics_path)), exist_ok=True)
+        tmp_path = f"{metrics_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, metrics_path)
+
+    def close(self):
+        self.write_metrics()
+        with self.lock:
+            if self.trace_fd is not None:
+                os.close(self.trace_fd)
+                self.trace_fd = None
+
+# -- Shared Telemetry Instance --
+# Switched on by TELEMETRY.enabled or AGENT_TELEMETRY=1
+TELEMETRY = Telemetry(
+    os.environ.get("AGENT_TELEMETRY", "1" if TELEMETRY_CONFIG["enabled"] else "0") not in ("", "0", "false"),
+    TELEMETRY_CONFIG["trace_path"],
+    TELEMETRY_CONFIG["metrics_path"],
+    TELEMETRY_CONFIG["metrics_interval"],
+)